@@ -0,0 +1 @@
+""" Offline tooling to record, replay and benchmark the node server update path. """
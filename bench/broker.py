@@ -0,0 +1,221 @@
+import ssl
+import socket
+import struct
+import logging
+import threading
+
+LOGGER = logging.getLogger("bench.broker")
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(pattern, topic):
+    """ MQTT topic filter matching, with + and # wildcards """
+    pattern_levels = pattern.split("/")
+    topic_levels = topic.split("/")
+    for n, level in enumerate(pattern_levels):
+        if level == "#":
+            return True
+        if n >= len(topic_levels) or (level != "+" and level != topic_levels[n]):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+def _encode_length(length):
+    encoded = bytearray()
+    while True:
+        digit, length = length % 128, length // 128
+        encoded.append(digit | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _encode_string(value):
+    data = value.encode("utf8")
+    return struct.pack("!H", len(data)) + data
+
+
+def _packet(packet_type, body=b"", flags=0):
+    return bytes([packet_type << 4 | flags]) + _encode_length(len(body)) + body
+
+
+class Connection:
+    def __init__(self, broker, sock, address):
+        self.broker = broker
+        self.sock = sock
+        self.address = address
+        self.client_id = None
+        self.subscriptions = set()
+        self._lock = threading.Lock()
+
+    def send(self, data):
+        with self._lock:
+            self.sock.sendall(data)
+
+    def publish(self, topic, payload):
+        self.send(_packet(PUBLISH, _encode_string(topic) + payload))
+
+    def serve(self):
+        try:
+            while True:
+                packet_type, flags, body = self._read_packet()
+                if not self._handle(packet_type, flags, body):
+                    break
+        except (OSError, ConnectionError, ValueError) as e:
+            LOGGER.debug("%s: connection closed: %s", self.client_id, e)
+        finally:
+            self.broker._disconnected(self)
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def _handle(self, packet_type, flags, body):
+        if packet_type == CONNECT:
+            # protocol name, level, flags, keep alive, then the client id
+            offset = 2 + struct.unpack("!H", body[:2])[0] + 4
+            length = struct.unpack("!H", body[offset : offset + 2])[0]
+            self.client_id = body[offset + 2 : offset + 2 + length].decode("utf8")
+            self.send(_packet(CONNACK, b"\x00\x00"))
+            self.broker._connected(self)
+
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, bytearray()
+            while offset < len(body):
+                length = struct.unpack("!H", body[offset : offset + 2])[0]
+                topic = body[offset + 2 : offset + 2 + length].decode("utf8")
+                self.subscriptions.add(topic)
+                granted.append(min(body[offset + 2 + length], 1))
+                offset += 3 + length
+            self.send(_packet(SUBACK, packet_id + bytes(granted)))
+
+        elif packet_type == UNSUBSCRIBE:
+            packet_id, offset = body[:2], 2
+            while offset < len(body):
+                length = struct.unpack("!H", body[offset : offset + 2])[0]
+                self.subscriptions.discard(body[offset + 2 : offset + 2 + length].decode("utf8"))
+                offset += 2 + length
+            self.send(_packet(UNSUBACK, packet_id, flags=0))
+
+        elif packet_type == PUBLISH:
+            length = struct.unpack("!H", body[:2])[0]
+            topic = body[2 : 2 + length].decode("utf8")
+            offset = 2 + length
+            qos = (flags >> 1) & 0x03
+            if qos:
+                self.send(_packet(PUBACK, body[offset : offset + 2]))
+                offset += 2
+            self.broker.publish(topic, body[offset:])
+
+        elif packet_type == PINGREQ:
+            self.send(_packet(PINGRESP))
+
+        elif packet_type == DISCONNECT:
+            return False
+
+        return True
+
+    def _read_packet(self):
+        header = self._read(1)[0]
+        length, multiplier = 0, 1
+        while True:
+            digit = self._read(1)[0]
+            length += (digit & 0x7F) * multiplier
+            multiplier *= 128
+            if not digit & 0x80:
+                break
+        return header >> 4, header & 0x0F, self._read(length)
+
+    def _read(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("eof")
+            data += chunk
+        return data
+
+
+class Broker:
+    """
+    Minimal MQTT 3.1.1 broker for local load tests: CONNECT, (UN)SUBSCRIBE,
+    PUBLISH and PINGREQ, delivering everything at QoS 0. There is no
+    retained message or session state, and with an ssl_context clients are
+    served over TLS.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, ssl_context=None):
+        self.ssl_context = ssl_context
+        self.connections = []
+        self.published = 0
+        self._lock = threading.Lock()
+        self._server = socket.create_server((host, port))
+        self._thread = threading.Thread(
+            target=self._accept, name="bench-broker", daemon=True
+        )
+
+    @property
+    def port(self):
+        return self._server.getsockname()[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.close()
+        self.disconnect_all()
+
+    def publish(self, topic, payload):
+        """ Delivers payload to every connection subscribed to topic """
+        if isinstance(payload, str):
+            payload = payload.encode("utf8")
+        with self._lock:
+            connections = list(self.connections)
+        for connection in connections:
+            if any(topic_matches(s, topic) for s in connection.subscriptions):
+                try:
+                    connection.publish(topic, payload)
+                    self.published += 1
+                except OSError:
+                    pass
+
+    def disconnect_all(self):
+        """ Drops every client, eg. to exercise reconnect handling """
+        for connection in list(self.connections):
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _accept(self):
+        while True:
+            try:
+                sock, address = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(
+                target=self._serve, args=(sock, address), daemon=True
+            ).start()
+
+    def _serve(self, sock, address):
+        if self.ssl_context is not None:
+            try:
+                sock = self.ssl_context.wrap_socket(sock, server_side=True)
+            except (ssl.SSLError, OSError) as e:
+                LOGGER.warning("TLS handshake with %s failed: %s", address, e)
+                sock.close()
+                return
+        Connection(self, sock, address).serve()
+
+    def _connected(self, connection):
+        with self._lock:
+            self.connections.append(connection)
+        LOGGER.info("%s connected", connection.client_id)
+
+    def _disconnected(self, connection):
+        with self._lock:
+            if connection in self.connections:
+                self.connections.remove(connection)
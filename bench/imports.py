@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Import-time benchmark: imports each module in fresh interpreters and reports
+the median wall time plus the heaviest imports it pulls in (-X importtime).
+
+    python -m bench.imports nodes thinq2.controller.thinq --repeat 7
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+SNIPPET = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+
+def measure(module, repeat=5):
+    """ Returns (wall times in seconds, -X importtime lines of the last run) """
+    times, lines = [], []
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", SNIPPET.format(module=module)],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+        lines = result.stderr.splitlines()
+    return times, lines
+
+
+def heaviest(lines, depth=2, count=10):
+    """ (cumulative us, name) of imports nested at most `depth` levels deep """
+    entries = []
+    for line in lines:
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        level = (len(name) - len(name.lstrip())) // 2
+        if level <= depth:
+            entries.append((int(cumulative), name.strip()))
+    return sorted(entries, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=["nodes", "thinq2.controller.thinq"])
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=10, help="heaviest imports to list")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        times, lines = measure(module, args.repeat)
+        print(
+            "{}: median {:.1f} ms, min {:.1f} ms over {} runs".format(
+                module,
+                statistics.median(times) * 1e3,
+                min(times) * 1e3,
+                len(times),
+            )
+        )
+        for cumulative, name in heaviest(lines, count=args.top):
+            print("  {:>9.1f} ms  {}".format(cumulative / 1e3, name))
+
+
+if __name__ == "__main__":
+    main()
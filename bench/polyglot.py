@@ -0,0 +1,159 @@
+import sys
+import types
+import logging
+import threading
+
+from collections import defaultdict
+
+LOGGER = logging.getLogger("udi_interface")
+
+
+class Node:
+    """ Stand-in for udi_interface.Node that records driver updates in memory """
+
+    drivers = []
+    commands = {}
+    id = "node"
+
+    def __init__(self, poly, primary, address, name):
+        self.poly = poly
+        self.primary = primary
+        self.address = address
+        self.name = name
+        self.values = {d["driver"]: d["value"] for d in self.drivers}
+
+    def setDriver(self, driver, value, report=True, force=False, uom=None, text=None):
+        changed = self.values.get(driver) != value
+        self.values[driver] = value
+        if report and (changed or force):
+            self.poly.report(self.address, driver, value)
+
+    def getDriver(self, driver):
+        return self.values.get(driver)
+
+    def reportDriver(self, driver, force=False):
+        self.poly.report(self.address, driver, self.values.get(driver))
+
+    def reportDrivers(self):
+        for driver, value in self.values.items():
+            self.poly.report(self.address, driver, value)
+
+    def reportCmd(self, command, value=None, uom=None):
+        pass
+
+    def query(self, command=None):
+        self.reportDrivers()
+
+
+class LogHandler:
+    def set_log_format(self, format):
+        pass
+
+    def set_basic_config(self, enable, level):
+        pass
+
+
+class Custom(dict):
+    def __init__(self, poly, name):
+        super().__init__()
+        self.poly = poly
+        self.name = name
+
+    def load(self, data, save=False):
+        self.clear()
+        if data:
+            self.update(data)
+
+    def delete(self, key):
+        self.pop(key, None)
+
+
+class Interface:
+    """
+    Stand-in for udi_interface.Interface: nodes are added synchronously
+    (START and ADDNODEDONE fire from addNode) and every driver report that
+    would go to Polyglot is counted instead.
+    """
+
+    CONFIG = "config"
+    START = "start"
+    STOP = "stop"
+    DELETE = "delete"
+    ADDNODEDONE = "addnodedone"
+    CUSTOMPARAMS = "customparams"
+    CUSTOMTYPEDPARAMS = "customtypedparams"
+    CUSTOMTYPEDDATA = "customtypeddata"
+    POLL = "poll"
+    DISCOVER = "discover"
+
+    def __init__(self, classes=None, envVar=None):
+        self.nodes = {}
+        self.reports = 0
+        self.last_reports = {}
+        self._subscribers = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def subscribe(self, event, callback, address=None):
+        self._subscribers[event].append((callback, address))
+
+    def publish(self, event, *args, address=None):
+        for callback, subscribed in list(self._subscribers[event]):
+            if subscribed is None or address is None or subscribed == address:
+                callback(*args)
+
+    def addNode(self, node, conn_status=None, rename=False):
+        self.nodes[node.address] = node
+        self.publish(self.START, address=node.address)
+        self.publish(self.ADDNODEDONE, {"address": node.address})
+        return node
+
+    def getNode(self, address):
+        return self.nodes.get(address)
+
+    def getNodes(self):
+        return self.nodes
+
+    def delNode(self, address):
+        self.nodes.pop(address, None)
+
+    def report(self, address, driver, value):
+        with self._lock:
+            self.reports += 1
+            self.last_reports[(address, driver)] = value
+
+    def poll(self, polltype):
+        self.publish(self.POLL, polltype)
+
+    def start(self, *args, **kwargs):
+        pass
+
+    def ready(self):
+        pass
+
+    def stop(self):
+        self.publish(self.STOP)
+
+    def updateProfile(self):
+        pass
+
+    def setCustomParamsDoc(self):
+        pass
+
+    def runForever(self):
+        pass
+
+
+def install():
+    """
+    Makes `import udi_interface` resolve to this stub; call it before any
+    module from nodes/ is imported.
+    """
+    module = types.ModuleType("udi_interface")
+    module.Node = Node
+    module.Interface = Interface
+    module.Custom = Custom
+    module.ISY = object
+    module.LOGGER = LOGGER
+    module.LOG_HANDLER = LogHandler()
+    sys.modules["udi_interface"] = module
+    return module
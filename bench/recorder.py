@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Records a live session for bench.replay: every REST response, the model JSON
+of every device and the raw MQTT payloads, one JSON object per line.
+
+    python -m bench.recorder recording.jsonl --state state/state.json --duration 600
+"""
+import json
+import time
+import logging
+import argparse
+import threading
+
+from thinq2.client.base import session_pool
+from thinq2.controller.thinq import ThinQ
+from thinq2.controller.session import SessionStore
+
+LOGGER = logging.getLogger("bench.recorder")
+
+
+class Recorder:
+    """ Appends timestamped entries (kind, t, ...) to a JSON lines file """
+
+    def __init__(self, path):
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.entries = 0
+
+    def write(self, kind, **entry):
+        line = json.dumps(dict(kind=kind, t=time.monotonic() - self._started, **entry))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.entries += 1
+
+    def attach(self, thinq):
+        """ Records REST responses and MQTT messages of thinq from now on """
+        session_pool.add_response_hook(self.record_response)
+
+        client = thinq.mqtt.client
+        on_message = client.on_message
+
+        def record_message(client, userdata, msg):
+            self.record_message(msg)
+            on_message(client, userdata, msg)
+
+        client.on_message = record_message
+
+    def record_response(self, response, *args, **kwargs):
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+        self.write(
+            "rest",
+            method=response.request.method,
+            url=response.request.url,
+            status=response.status_code,
+            body=body,
+        )
+
+    def record_message(self, msg):
+        self.write("mqtt", topic=msg.topic, payload=msg.payload.decode("utf8"))
+
+    def record_model_json(self, device):
+        self.write("model_json", model_name=device.model_name, document=device.model_json)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("recording", help="file to append the recording to")
+    parser.add_argument("--state", default="state/state.json", help="session file")
+    parser.add_argument("--duration", type=float, default=600, help="seconds of MQTT")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = SessionStore(args.state)
+    thinq = ThinQ(store.load())
+    thinq.auth.on_token_refresh = lambda auth: store.save(thinq)
+    # MQTT registration logs through it, and only start() would set it
+    thinq.mqtt.logger = LOGGER
+
+    recorder = Recorder(args.recording)
+    recorder.attach(thinq)
+
+    devices = thinq.refresh_devices()
+    for device in devices:
+        LOGGER.info("%s: %s (model %s)", device.device_id, device.alias, device.model_name)
+        recorder.record_model_json(device)
+
+    thinq.start(LOGGER)
+    LOGGER.info("recording MQTT for %ss", args.duration)
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        thinq.stop()
+        store.save(thinq, immediate=True)
+        recorder.close()
+    LOGGER.info("recorded %d entries", recorder.entries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+"""
+Replays a bench.recorder recording through the MQTT update path
+(ThinQMQTT._on_message -> ThinQ dispatch -> ThinQDevice.update -> node
+_reportDriver) against a stub Polyglot interface, and reports throughput,
+per-stage latency percentiles and memory.
+
+    python -m bench.replay recording.jsonl --devices 200 --rate 500 --messages 20000
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import threading
+import tracemalloc
+
+from dataclasses import replace
+from types import SimpleNamespace
+
+from bench import polyglot
+
+polyglot.install()
+
+from thinq2.controller.thinq import ThinQ
+from thinq2.model.thinq import DeviceCollection
+from thinq2.model.device.dishwasher import DishWasherDevice
+from thinq2.model.device.washerdryer import WasherDryerDevice
+from nodes import WasherDryerNode, DishWasherNode
+
+LOGGER = logging.getLogger("bench.replay")
+
+# enough of a ThinQConfiguration to build controllers; nothing is contacted
+OFFLINE_STATE = {
+    "auth": {
+        "country_code": "US",
+        "language_code": "en-US",
+        "client_id": "0" * 64,
+        "gateway": {
+            "countryCode": "US",
+            "languageCode": "en-US",
+            "thinq1Uri": "http://127.0.0.1:9/thinq1",
+            "thinq2Uri": "http://127.0.0.1:9/v1",
+            "empUri": "http://127.0.0.1:9/emp",
+        },
+        "profile": {"userID": "bench", "userNo": "bench"},
+        "token": {"access_token": "bench", "expires_in": "3600", "refresh_token": "bench"},
+    },
+    "mqtt": {
+        "route": {"apiServer": "http://127.0.0.1:9", "mqttServer": "ssl://127.0.0.1:9"},
+        "ca_cert": "",
+        "private_key": "",
+        "csr": "",
+    },
+}
+
+STAGES = ("decode", "dispatch", "update", "report", "end_to_end")
+
+
+class Recording:
+    def __init__(self, path):
+        self.dashboard = None
+        self.model_json = {}
+        self.payloads = []
+
+        with open(path, "r") as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry["kind"] == "mqtt":
+                    self.payloads.append(json.loads(entry["payload"]))
+                elif entry["kind"] == "model_json":
+                    self.model_json[entry["model_name"]] = entry["document"]
+                elif entry["kind"] == "rest" and entry["url"].split("?")[0].endswith(
+                    "service/application/dashboard"
+                ):
+                    self.dashboard = entry["body"]
+
+        if self.dashboard is None:
+            raise ValueError("{} has no dashboard response".format(path))
+
+    @property
+    def descriptors(self):
+        return DeviceCollection.Schema().load(self.dashboard["result"]).items
+
+
+class StageTimer:
+    """ Latency samples per stage, in seconds """
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def percentiles(self, stage, points=(50, 90, 99)):
+        samples = sorted(self.samples[stage])
+        if not samples:
+            return {}
+        result = {
+            "p{}".format(p): samples[min(len(samples) - 1, len(samples) * p // 100)]
+            for p in points
+        }
+        result["max"] = samples[-1]
+        result["n"] = len(samples)
+        return result
+
+
+class Replay:
+    def __init__(self, recording, devices, direct=False, workers=None):
+        self.recording = recording
+        self.timer = StageTimer()
+        self.poly = polyglot.Interface()
+        self.thinq = ThinQ(OFFLINE_STATE)
+        self.thinq.mqtt.logger = LOGGER
+        if workers is not None:
+            self.thinq.dispatch_workers = workers
+
+        # (perf_counter at feed, at hand-off) of the latest message per device
+        self._fed = {}
+        self._feed = threading.local()
+        self._instrument(direct)
+
+        for name, document in recording.model_json.items():
+            self.thinq.model_json_cache.put(name, None, document)
+        self.devices = self._create_devices(devices)
+        self.payloads = self._assign_payloads()
+
+    def _instrument(self, direct):
+        thinq = self.thinq
+        handoff = thinq._notify_device if direct else thinq._queue_device_message
+        update_device = thinq._update_device
+
+        def on_device_message(message):
+            now = time.perf_counter()
+            self.timer.add("decode", now - self._feed.started)
+            if message is not None:
+                self._fed[message.device_id] = (self._feed.started, now)
+            handoff(message)
+
+        def timed_update_device(device_id, reported):
+            fed, handed_off = self._fed.get(device_id, (None, None))
+            started = time.perf_counter()
+            if handed_off is not None:
+                self.timer.add("dispatch", started - handed_off)
+            update_device(device_id, reported)
+            finished = time.perf_counter()
+            self.timer.add("update", finished - started)
+            if fed is not None:
+                self.timer.add("end_to_end", finished - fed)
+
+        # set before the dispatcher is created so it picks up the wrapper
+        thinq._update_device = timed_update_device
+        thinq.mqtt.message_filter = thinq._wants_message
+        thinq.mqtt.on_device_message = on_device_message
+
+    def _create_devices(self, count):
+        descriptors = self.recording.descriptors
+        devices = []
+        for n in range(count):
+            descriptor = descriptors[n % len(descriptors)]
+            if count > len(descriptors):
+                descriptor = replace(
+                    descriptor, device_id="{}-{:05d}".format(descriptor.device_id, n)
+                )
+            device = self.thinq.devices.add(self.thinq._create_device(descriptor))
+            self._add_node(device)
+            devices.append((descriptors[n % len(descriptors)].device_id, device))
+        return devices
+
+    def _add_node(self, device):
+        address = "l{}".format(device.device_id)[:14] + str(len(self.poly.nodes))
+        if isinstance(device.snapshot, WasherDryerDevice):
+            node = WasherDryerNode(self.poly, "controller", address, address, device, self.thinq)
+        elif isinstance(device.snapshot, DishWasherDevice):
+            node = DishWasherNode(self.poly, "controller", address, address, device, self.thinq)
+        else:
+            return
+
+        report = node._reportDriver
+
+        def timed_report():
+            started = time.perf_counter()
+            report()
+            self.timer.add("report", time.perf_counter() - started)
+
+        self.poly.addNode(node)
+        node._reportDriver = timed_report
+
+    def _assign_payloads(self):
+        """ Recorded payloads per original device id, or synthetic ones """
+        recorded = {}
+        for payload in self.recording.payloads:
+            recorded.setdefault(payload.get("deviceId"), []).append(payload)
+
+        snapshots = {
+            item["deviceId"]: item.get("snapshot", {})
+            for item in self.recording.dashboard["result"]["item"]
+        }
+        return {
+            original: recorded.get(original)
+            or synthetic_payloads(original, snapshots.get(original, {}))
+            for original, device in self.devices
+        }
+
+    def messages(self, count):
+        """ Pre-encoded messages, round-robin over the devices """
+        messages = []
+        for n in range(count):
+            original, device = self.devices[n % len(self.devices)]
+            candidates = self.payloads[original]
+            payload = dict(candidates[(n // len(self.devices)) % len(candidates)])
+            payload["deviceId"] = device.device_id
+            messages.append(
+                SimpleNamespace(
+                    topic="bench", payload=json.dumps(payload).encode("utf8")
+                )
+            )
+        return messages
+
+    def run(self, messages, rate=0):
+        on_message = self.thinq.mqtt._on_message
+        started = time.perf_counter()
+        for n, message in enumerate(messages):
+            if rate:
+                delay = started + n / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self._feed.started = time.perf_counter()
+            on_message(None, None, message)
+        fed = time.perf_counter()
+        self.thinq.dispatcher.drain()
+        return fed - started, time.perf_counter() - started
+
+
+def synthetic_payloads(device_id, snapshot, count=60):
+    """ Counts the remaining time down, for devices without recorded messages """
+    key = next(
+        (k for k, v in snapshot.items() if isinstance(v, dict) and "remainTimeMinute" in v),
+        "state",
+    )
+    return [
+        {
+            "deviceId": device_id,
+            "type": "monitoring",
+            "data": {"state": {"reported": {key: {"remainTimeMinute": minute}}}},
+        }
+        for minute in range(count, 0, -1)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("recording", help="file written by bench.recorder")
+    parser.add_argument("--devices", type=int, default=1, help="simulated devices")
+    parser.add_argument("--messages", type=int, default=10000, help="messages to feed")
+    parser.add_argument("--rate", type=float, default=0, help="messages/s, 0 = max")
+    parser.add_argument("--workers", type=int, help="dispatcher worker threads")
+    parser.add_argument("--direct", action="store_true", help="bypass the dispatcher")
+    parser.add_argument("--tracemalloc", action="store_true", help="trace allocations")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    replay = Replay(
+        Recording(args.recording), args.devices, direct=args.direct, workers=args.workers
+    )
+    messages = replay.messages(args.messages)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    feed_time, total_time = replay.run(messages, args.rate)
+    dispatcher = replay.thinq.dispatcher
+
+    results = {
+        "devices": len(replay.devices),
+        "messages": len(messages),
+        "feed_seconds": feed_time,
+        "total_seconds": total_time,
+        "messages_per_second": len(messages) / total_time,
+        "updates": len(replay.timer.samples["update"]),
+        "coalesced": dispatcher.coalesced,
+        "dropped": dispatcher.dropped,
+        "driver_reports": replay.poly.reports,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "stages": {stage: replay.timer.percentiles(stage) for stage in STAGES},
+    }
+    if args.tracemalloc:
+        current, peak = tracemalloc.get_traced_memory()
+        results.update(traced_kb=current // 1024, traced_peak_kb=peak // 1024)
+    dispatcher.stop()
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+
+    for key, value in results.items():
+        if key != "stages":
+            print("{:<22} {}".format(key, round(value, 3) if isinstance(value, float) else value))
+    print("\n{:<12} {:>8} {:>10} {:>10} {:>10} {:>10}".format(
+        "stage", "n", "p50 ms", "p90 ms", "p99 ms", "max ms"
+    ))
+    for stage, p in results["stages"].items():
+        if p:
+            print("{:<12} {:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                stage, p["n"], p["p50"] * 1e3, p["p90"] * 1e3, p["p99"] * 1e3, p["max"] * 1e3
+            ))
+
+
+if __name__ == "__main__":
+    main()
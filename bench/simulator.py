@@ -0,0 +1,595 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the LG ThinQ cloud: the REST endpoints used by thinq2's
+clients and a TLS MQTT broker publishing washer, dryer and dishwasher cycles
+for any number of simulated devices.
+
+    python -m bench.simulator --devices 300 --state state/state.json
+
+writes an authenticated session pointing at the simulator, so the node server
+(or nodes/test.py with STATE_FILE) runs against it unchanged.
+"""
+import re
+import ssl
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import datetime
+import ipaddress
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from thinq2 import AWS_IOTT_ALPN_PROTOCOL
+from thinq2.controller.session import SessionStore
+from thinq2.util.filesystem import ephemeral_file
+from bench.broker import Broker
+
+LOGGER = logging.getLogger("bench.simulator")
+
+KINDS = {
+    "washer": dict(device_type=201, model="SIMWASHER", key="washerDryer", running="RUNNING"),
+    "dryer": dict(device_type=202, model="SIMDRYER", key="washerDryer", running="DRYING"),
+    "dishwasher": dict(device_type=204, model="SIMDISHWASHER", key="dishwasher", running="RUNNING"),
+}
+
+STATES = ["POWEROFF", "INITIAL", "RUNNING", "DRYING", "PAUSE", "END", "ERROR"]
+
+
+def _pem(key):
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    ).decode("utf8")
+
+
+def _new_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+class CertificateAuthority:
+    """ Self-signed CA for the broker certificate and registered MQTT clients """
+
+    def __init__(self):
+        self.key = _new_key()
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "ThinQ Simulator CA")])
+        self.cert = (
+            self._builder(name, self.key.public_key())
+            .issuer_name(name)
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+            .sign(self.key, hashes.SHA256())
+        )
+
+    @property
+    def pem(self):
+        return self.cert.public_bytes(serialization.Encoding.PEM).decode("utf8")
+
+    def issue(self, common_name, public_key, hosts=()):
+        builder = self._builder(
+            x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)]), public_key
+        ).issuer_name(self.cert.subject)
+        if hosts:
+            builder = builder.add_extension(
+                x509.SubjectAlternativeName([_general_name(h) for h in hosts]),
+                critical=False,
+            )
+        cert = builder.sign(self.key, hashes.SHA256())
+        return cert.public_bytes(serialization.Encoding.PEM).decode("utf8")
+
+    def sign_csr(self, csr_pem):
+        csr = x509.load_pem_x509_csr(csr_pem.encode("utf8"))
+        return self.issue("ThinQ Simulator Client", csr.public_key())
+
+    def server_context(self, hosts):
+        """ Broker TLS context: ALPN like AWS IoT, client certs checked if sent """
+        key = _new_key()
+        cert = self.issue(hosts[0], key.public_key(), hosts)
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.set_alpn_protocols([AWS_IOTT_ALPN_PROTOCOL])
+        context.verify_mode = ssl.CERT_OPTIONAL
+        context.load_verify_locations(cadata=self.pem)
+        with ephemeral_file(cert) as certfile, ephemeral_file(_pem(key)) as keyfile:
+            context.load_cert_chain(certfile=certfile, keyfile=keyfile)
+        return context
+
+    def _builder(self, name, public_key):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .public_key(public_key)
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=365))
+        )
+
+
+def _general_name(host):
+    try:
+        return x509.IPAddress(ipaddress.ip_address(host))
+    except ValueError:
+        return x509.DNSName(host)
+
+
+class SimulatedDevice:
+    """
+    An appliance running cycles on the simulated clock: off for a while, then
+    INITIAL, a running phase counting remainTime down each minute, END, off.
+    """
+
+    def __init__(self, n, kind, rng):
+        self.kind = kind
+        self.spec = KINDS[kind]
+        self.device_id = str(uuid.uuid5(uuid.NAMESPACE_OID, "thinq-sim-{}".format(n)))
+        self.alias = "Sim {} {}".format(kind.title(), n)
+        self.order = n
+        self.rng = rng
+        self.state = {
+            "state": "POWEROFF",
+            "remainTimeHour": 0,
+            "remainTimeMinute": 0,
+            "initialTimeHour": 0,
+            "initialTimeMinute": 0,
+        }
+        if kind == "dishwasher":
+            self.state["door"] = "CLOSE"
+        self.timestamp = time.time()
+        # minutes left in the current phase; staggered so devices don't move in lockstep
+        self._phase_left = rng.randint(0, 60)
+
+    def minute(self):
+        """ Advances one simulated minute, returning the changed fields """
+        before = dict(self.state)
+        state = self.state["state"]
+        self._phase_left -= 1
+
+        if state in ("RUNNING", "DRYING"):
+            remain = self.state["remainTimeHour"] * 60 + self.state["remainTimeMinute"] - 1
+            if remain <= 0:
+                self._set_phase("END", 2)
+                if self.kind == "dishwasher":
+                    self.state["door"] = "OPEN" if self.rng.random() < 0.5 else "CLOSE"
+            else:
+                self.state["remainTimeHour"], self.state["remainTimeMinute"] = divmod(remain, 60)
+
+        elif self._phase_left <= 0:
+            if state == "POWEROFF":
+                self._set_phase("INITIAL", 1)
+                if self.kind == "dishwasher":
+                    self.state["door"] = "CLOSE"
+            elif state == "INITIAL":
+                total = self.rng.randint(30, 120)
+                self._set_phase(self.spec["running"], total)
+                hours, minutes = divmod(total, 60)
+                self.state.update(
+                    remainTimeHour=hours,
+                    remainTimeMinute=minutes,
+                    initialTimeHour=hours,
+                    initialTimeMinute=minutes,
+                )
+            else:
+                self._set_phase("POWEROFF", self.rng.randint(10, 240))
+                self.state.update(remainTimeHour=0, remainTimeMinute=0)
+
+        changed = {k: v for k, v in self.state.items() if before.get(k) != v}
+        if changed:
+            self.timestamp = time.time()
+        return changed
+
+    def _set_phase(self, state, minutes):
+        self.state["state"] = state
+        self._phase_left = minutes
+
+    def message(self, changed):
+        return {
+            "deviceId": self.device_id,
+            "type": "monitoring",
+            "data": {"state": {"reported": {self.spec["key"]: changed, "online": True}}},
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+
+    def item(self, user_no):
+        """ Dashboard / device descriptor entry """
+        offset = "-05:00"
+        return {
+            "deviceId": self.device_id,
+            "modelName": self.spec["model"],
+            "deviceType": self.spec["device_type"],
+            "platformType": "thinq2",
+            "alias": self.alias,
+            "modelCountryCode": "US",
+            "countryCode": "US",
+            "fwVer": "1.0.0",
+            "ssid": "simulator",
+            "macAddress": "02:00:00:{:02x}:{:02x}:{:02x}".format(
+                self.order >> 16 & 0xFF, self.order >> 8 & 0xFF, self.order & 0xFF
+            ),
+            "networkType": "02",
+            "timezoneCode": "America/New_York",
+            "timezoneCodeAlias": "US/Eastern",
+            "utcOffset": -5,
+            "utcOffsetDisplay": offset,
+            "dstOffset": -4,
+            "dstOffsetDisplay": "-04:00",
+            "curOffset": -5,
+            "curOffsetDisplay": offset,
+            "newRegYn": "N",
+            "remoteControlType": "",
+            "userNo": user_no,
+            "deviceState": "E",
+            "online": True,
+            "area": 0,
+            "regDt": 20210101000000.0,
+            "blackboxYn": True,
+            "order": self.order,
+            "drServiceYn": "N",
+            "regDtUtc": "20210101050000",
+            "groupableYn": "N",
+            "controllableYn": "Y",
+            "combinedProductYn": "N",
+            "masterYn": "Y",
+            "tclcount": 0,
+            "snapshot": {
+                self.spec["key"]: dict(self.state),
+                "online": True,
+                "timestamp": self.timestamp * 1000,
+                "static": {"deviceType": str(self.spec["device_type"]), "countryCode": "US"},
+                "meta": {"allDeviceInfoUpdate": False, "messageId": uuid.uuid4().hex},
+            },
+        }
+
+
+def model_json(kind):
+    spec = KINDS[kind]
+    monitoring = {
+        "state": {
+            "dataType": "enum",
+            "valueMapping": {s: {"index": n} for n, s in enumerate(STATES)},
+        },
+        "remainTimeHour": {"dataType": "range"},
+        "remainTimeMinute": {"dataType": "range"},
+        "initialTimeHour": {"dataType": "range"},
+        "initialTimeMinute": {"dataType": "range"},
+    }
+    if kind == "dishwasher":
+        monitoring["door"] = {
+            "dataType": "enum",
+            "valueMapping": {"CLOSE": {"index": 0}, "OPEN": {"index": 1}},
+        }
+    return {
+        "Info": {"modelName": spec["model"], "version": "1.0", "modelType": kind.upper()},
+        "MonitoringValue": monitoring,
+    }
+
+
+class Simulator:
+    """
+    Serves the ThinQ REST API over HTTP and device updates over a TLS MQTT
+    broker. Every `tick` seconds the simulated clock advances by `speed`
+    times as much; each simulated minute every device may change state and
+    publishes what changed to the clients registered for MQTT.
+    """
+
+    def __init__(
+        self,
+        devices=100,
+        host="127.0.0.1",
+        port=0,
+        mqtt_port=0,
+        tick=1.0,
+        speed=60.0,
+        token_lifetime=3600,
+        seed=0,
+    ):
+        rng = random.Random(seed)
+        kinds = list(KINDS)
+        self.devices = {
+            device.device_id: device
+            for device in (
+                SimulatedDevice(n, kinds[n % len(kinds)], rng) for n in range(devices)
+            )
+        }
+        self.host = host
+        self.tick = tick
+        self.speed = speed
+        self.token_lifetime = token_lifetime
+        self.user_no = "SIM0000001"
+        self.clients = set()
+        self.tokens = {}
+        self.requests = 0
+        # result code every /v1/service call answers with while set, eg.
+        # "0112" to exercise throttling handling
+        self.fault = None
+
+        self.ca = CertificateAuthority()
+        self.broker = Broker(host, mqtt_port, self.ca.server_context([host, "localhost"]))
+        self.http = ThreadingHTTPServer((host, port), self._handler())
+        self._lock = threading.Lock()
+        self._running = threading.Event()
+        self._minutes = 0.0
+
+    @property
+    def base_url(self):
+        return "http://{}:{}".format(self.host, self.http.server_address[1])
+
+    @property
+    def mqtt_url(self):
+        return "ssl://{}:{}".format(self.host, self.broker.port)
+
+    def start(self):
+        self.broker.start()
+        threading.Thread(target=self.http.serve_forever, name="sim-http", daemon=True).start()
+        self._running.set()
+        threading.Thread(target=self._run, name="sim-clock", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        self.http.shutdown()
+        self.http.server_close()
+        self.broker.stop()
+
+    def session_state(self, client_id=None):
+        """ An authenticated ThinQConfiguration dict pointing at the simulator """
+        client_id = client_id or uuid.uuid4().hex * 2
+        key = _new_key()
+        csr = (
+            x509.CertificateSigningRequestBuilder()
+            .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "AWS IoT Certificate")]))
+            .sign(key, hashes.SHA256())
+        )
+        return {
+            "auth": {
+                "country_code": "US",
+                "language_code": "en-US",
+                "client_id": client_id,
+                "gateway": self.gateway,
+                "profile": {"userID": "simulator", "userNo": self.user_no},
+                "token": dict(self._issue_token(), expires_at=time.time() + self.token_lifetime),
+            },
+            "mqtt": {
+                "route": {"apiServer": self.base_url, "mqttServer": self.mqtt_url},
+                "ca_cert": self.ca.pem,
+                "private_key": _pem(key),
+                "csr": csr.public_bytes(serialization.Encoding.PEM).decode("utf8"),
+            },
+        }
+
+    @property
+    def gateway(self):
+        return {
+            "countryCode": "US",
+            "languageCode": "en-US",
+            "thinq1Uri": self.base_url + "/api",
+            "thinq2Uri": self.base_url + "/v1",
+            "empUri": self.base_url + "/emp",
+        }
+
+    def _issue_token(self):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self.tokens[token] = time.time() + self.token_lifetime
+        return {
+            "access_token": token,
+            "expires_in": str(self.token_lifetime),
+            "refresh_token": "sim-refresh",
+            "oauth2_backend_url": self.base_url + "/",
+        }
+
+    def _token_valid(self, token):
+        return self.tokens.get(token, 0) > time.time()
+
+    def _run(self):
+        while self._running.is_set():
+            time.sleep(self.tick)
+            self._minutes += self.tick * self.speed / 60
+            while self._minutes >= 1:
+                self._minutes -= 1
+                self._advance()
+
+    def _advance(self):
+        with self._lock:
+            topics = ["app/clients/{}/push".format(c) for c in self.clients]
+        for device in self.devices.values():
+            changed = device.minute()
+            if changed and topics:
+                payload = json.dumps(device.message(changed))
+                for topic in topics:
+                    self.broker.publish(topic, payload)
+
+    def _handler(self):
+        simulator = self
+        routes = []
+
+        def route(method, pattern):
+            def register(func):
+                routes.append((method, re.compile(pattern + "$"), func))
+                return func
+
+            return register
+
+        def ok(result=None):
+            return 200, {"resultCode": "0000", "result": result}
+
+        @route("GET", r"/v1/service/application/gateway-uri")
+        def gateway(request, query, body):
+            return ok(simulator.gateway)
+
+        @route("GET", r"/route")
+        def mqtt_route(request, query, body):
+            return ok({"apiServer": simulator.base_url, "mqttServer": simulator.mqtt_url})
+
+        @route("POST", r"/oauth/1\.0/oauth2/token")
+        def token(request, query, body):
+            return 200, simulator._issue_token()
+
+        @route("GET", r"/oauth/1\.0/users/profile")
+        def profile(request, query, body):
+            return 200, {"account": {"userID": "simulator", "userNo": simulator.user_no}}
+
+        @route("GET", r"/v1/service/application/dashboard")
+        def dashboard(request, query, body):
+            items = [d.item(simulator.user_no) for d in simulator.devices.values()]
+            return ok({"item": items})
+
+        @route("GET", r"/v1/service/devices/(?P<device_id>[^/]+)")
+        def device(request, query, body, device_id):
+            device = simulator.devices.get(device_id)
+            if device is None:
+                return 200, {"resultCode": "0106"}
+            return ok(device.item(simulator.user_no))
+
+        @route("GET", r"/v1/service/application/modeljson")
+        def modeljson_descriptor(request, query, body):
+            device = simulator.devices.get(query.get("deviceId", [None])[0])
+            if device is None:
+                return 200, {"resultCode": "0106"}
+            return ok(
+                {
+                    "modelJsonVer": "1.0",
+                    "modelJsonUri": "{}/objectstore/{}.json".format(
+                        simulator.base_url, device.kind
+                    ),
+                    "timestamp": int(time.time() * 1000),
+                }
+            )
+
+        @route("GET", r"/objectstore/(?P<kind>\w+)\.json")
+        def modeljson(request, query, body, kind):
+            if kind not in KINDS:
+                return 404, {}
+            return 200, model_json(kind)
+
+        @route("(GET|POST|DELETE)", r"/v1/service/users/client")
+        def client(request, query, body):
+            client_id = request.headers.get("x-client-id")
+            with simulator._lock:
+                if request.command == "GET":
+                    return ok(client_id in simulator.clients)
+                if request.command == "POST":
+                    simulator.clients.add(client_id)
+                else:
+                    simulator.clients.discard(client_id)
+            return ok()
+
+        @route("POST", r"/v1/service/users/client/certificate")
+        def certificate(request, query, body):
+            client_id = request.headers.get("x-client-id")
+            with simulator._lock:
+                simulator.clients.add(client_id)
+            return ok(
+                {
+                    "certificatePem": simulator.ca.sign_csr(body["csr"]),
+                    "subscriptions": ["app/clients/{}/push".format(client_id)],
+                }
+            )
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._dispatch()
+
+            def do_POST(self):
+                self._dispatch()
+
+            def do_DELETE(self):
+                self._dispatch()
+
+            def _dispatch(self):
+                simulator.requests += 1
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                body = self._body()
+
+                for method, pattern, func in routes:
+                    match = pattern.match(url.path)
+                    if match and re.fullmatch(method, self.command):
+                        if url.path.startswith("/v1/") and not self._authorized():
+                            return self._send(400, {"resultCode": "0102"})
+                        if url.path.startswith("/v1/service/") and simulator.fault:
+                            return self._send(200, {"resultCode": simulator.fault})
+                        return self._send(*func(self, query, body, **match.groupdict()))
+                self._send(404, {"resultCode": "9999"})
+
+            def _authorized(self):
+                token = self.headers.get("x-emp-token")
+                return token is None or simulator._token_valid(token)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if not length:
+                    return {}
+                data = self.rfile.read(length)
+                if "json" in (self.headers.get("Content-Type") or ""):
+                    return json.loads(data)
+                return {k: v[0] for k, v in parse_qs(data.decode("utf8")).items()}
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode("utf8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=100, help="simulated devices")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="HTTP port, 0 = any")
+    parser.add_argument("--mqtt-port", type=int, default=0, help="MQTT port, 0 = any")
+    parser.add_argument("--speed", type=float, default=60, help="simulated seconds per second")
+    parser.add_argument("--tick", type=float, default=1, help="seconds between clock steps")
+    parser.add_argument("--token-lifetime", type=int, default=3600, help="OAuth expires_in")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--state", help="write an authenticated session file here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    simulator = Simulator(
+        devices=args.devices,
+        host=args.host,
+        port=args.port,
+        mqtt_port=args.mqtt_port,
+        tick=args.tick,
+        speed=args.speed,
+        token_lifetime=args.token_lifetime,
+        seed=args.seed,
+    ).start()
+    LOGGER.info("REST on %s, MQTT on %s", simulator.base_url, simulator.mqtt_url)
+
+    if args.state:
+        SessionStore(args.state).save(simulator.session_state(), immediate=True)
+        LOGGER.info("session written to %s", args.state)
+
+    try:
+        while True:
+            time.sleep(60)
+            LOGGER.info(
+                "%d requests, %d MQTT messages, %d clients",
+                simulator.requests,
+                simulator.broker.published,
+                len(simulator.broker.connections),
+            )
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
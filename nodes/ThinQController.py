@@ -1,18 +1,17 @@
 import udi_interface
-import os 
 import re
-import json 
-import sys
 import time
 import threading
 from enum import Enum
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 
 # My Template Node
-from thinq2.controller.auth import ThinQAuth
-from thinq2.controller.thinq import ThinQ
-from thinq2.client.objectstore import ObjectStoreClient
-from thinq2.model.device.dishwasher import DishWasherDevice
-from thinq2.model.device.washerdryer import WasherDryerDevice
+# thinq2's controllers and models (uplink, marshmallow, pyOpenSSL, ...) are
+# imported where they are first used, so the node server reports to Polyglot
+# before paying for them
+from thinq2.controller.modeljson import ModelJsonCache
+from thinq2.controller.session import SessionStore
+from thinq2 import metrics
 from nodes import WasherDryerNode
 from nodes import DishWasherNode
 
@@ -43,12 +42,15 @@ class ThinQController(udi_interface.Node):
         # Config
         self.auth_url           = None
         self.thinq              = None
+        self.session_store      = SessionStore("state/state.json")
         self.handler_config_st  = None 
         self.config_state       = ConfigurationState.Start
         self.cfg_language_code  = None
         self.cfg_country_code   = None
 
-        self.n_queue = []
+        # address -> Future resolved by ADDNODEDONE, for nodes being added
+        self.pending_nodes      = {}
+        self.pending_nodes_lock = threading.Lock()
 
         self.Parameters      = Custom(polyglot, 'customparams')
         self.Notices         = Custom(polyglot, 'notices')
@@ -61,7 +63,7 @@ class ThinQController(udi_interface.Node):
         self.poly.subscribe(self.poly.CUSTOMTYPEDPARAMS,    self.typedParameterHandler)
         self.poly.subscribe(self.poly.CUSTOMTYPEDDATA,      self.typedDataHandler)
         self.poly.subscribe(self.poly.POLL,                 self.poll)
-        self.poly.subscribe(self.poly.ADDNODEDONE,          self.node_queue)
+        self.poly.subscribe(self.poly.ADDNODEDONE,          self.node_done)
 
         self.poly.subscribe(self.poly.CONFIG,               self.handler_config)
         self.poly.ready()
@@ -78,6 +80,10 @@ class ThinQController(udi_interface.Node):
 
     def stop(self):
         LOGGER.debug('stopping')
+        if self.thinq is not None:
+            self.thinq.stop()
+            self.saveThinQState()
+            self.session_store.flush()
 
     def handler_config(self, cfg_data):
         LOGGER.info(f'cfg_data={cfg_data}')
@@ -134,16 +140,20 @@ class ThinQController(udi_interface.Node):
         LOGGER.debug("starting short poll: {}".format(self.config_state))
 
         self.checkAuthState()
+        if self.thinq is not None:
+            self.saveThinQState()
+        LOGGER.debug("metrics: {}".format(metrics.registry.summary()))
         
     def checkAuthState(self):
-        if self.config_state.value < ConfigurationState.Ready.value and os.path.exists("state/state.json"):
+        if self.config_state.value < ConfigurationState.Ready.value and self.session_store.exists():
             LOGGER.debug("state file exists")
-            with open("state/state.json", "r") as f:
-                self.config_state = ConfigurationState.Ready
-                self.thinq = ThinQ(json.load(f))
-                LOGGER.debug("loaded state file, discovering")
-                self.startThinQ()
-                self.discover()
+            from thinq2.controller.thinq import ThinQ
+
+            self.config_state = ConfigurationState.Ready
+            self.thinq = ThinQ(self.session_store.load())
+            LOGGER.debug("loaded state file, discovering")
+            self.startThinQ()
+            self.discover()
                 
         elif self.config_state == ConfigurationState.Start:
             self.Notices['region'] = "Please set region_code and country_code below"
@@ -155,7 +165,8 @@ class ThinQController(udi_interface.Node):
        
         elif self.config_state == ConfigurationState.Region:
             self.Notices.clear()
-          
+            from thinq2.controller.auth import ThinQAuth
+
             auth = ThinQAuth(language_code=self.cfg_language_code, country_code=self.cfg_country_code)
             msg ='Please <a target="_blank" href="{}/">Sign-in to LG ThinQ account</a> and save the redirect URL to auth_url custom variable'.format(auth.oauth_login_url)
             self.Notices['auth_url'] = msg
@@ -164,6 +175,8 @@ class ThinQController(udi_interface.Node):
             self.config_state = ConfigurationState.WaitingForAuthentication
         
         elif self.config_state == ConfigurationState.WaitingForAuthentication:
+            from thinq2.controller.auth import ThinQAuth
+
             auth = ThinQAuth(language_code=self.cfg_language_code, country_code=self.cfg_country_code)
             msg ='Please <a target="_blank" href="{}/">Sign-in to LG ThinQ account</a> and save the redirect URL to auth_url custom variable'.format(auth.oauth_login_url)
             self.Notices['auth_url'] = msg
@@ -172,12 +185,14 @@ class ThinQController(udi_interface.Node):
        
         elif self.config_state == ConfigurationState.Authentication:
             self.config_state = ConfigurationState.Ready                
+            from thinq2.controller.auth import ThinQAuth
+            from thinq2.controller.thinq import ThinQ
 
             auth = ThinQAuth(language_code=self.cfg_language_code, country_code=self.cfg_country_code)
             auth.set_token_from_url(self.auth_url)
             
             self.thinq = ThinQ(auth=auth)
-            self.saveThinQState()
+            self.saveThinQState(immediate=True)
             
             LOGGER.debug("Done authenticating, call discover")
             
@@ -187,29 +202,55 @@ class ThinQController(udi_interface.Node):
         elif self.config_state == ConfigurationState.Ready:
             LOGGER.debug("do nothing... READY")
     
-    def saveThinQState(self): 
-        with open("state/state.json", "w") as f:
-            json.dump(vars(self.thinq), f)
+    def saveThinQState(self, immediate=False):
+        self.session_store.save(self.thinq, immediate=immediate)
+
+    def onTokenRefresh(self, auth):
+        LOGGER.debug("ThinQ token refreshed")
+        self.saveThinQState()
 
     def startThinQ(self):
+        self.thinq.model_json_cache = ModelJsonCache("state/modeljson")
+        self.thinq.auth.on_token_refresh = self.onTokenRefresh
+        self.thinq.mqtt.on_connection_change = self.onMQTTConnectionChange
         self.thinq.start(LOGGER)
 
+    def onMQTTConnectionChange(self, connected):
+        # ST reflects the MQTT connection; a reconnect triggers a dashboard
+        # refresh in ThinQ, so nodes catch up without waiting for longPoll
+        LOGGER.info("ThinQ MQTT {}".format("connected" if connected else "disconnected"))
+        self.setDriver('ST', 1 if connected else 0)
+
     def thinqHandler(self, client, userdata, msg):
         print(msg.payload)
 
     def query(self,command=None):
-        nodes = self.poly.getNodes()
-        for node in nodes:
-            if nodes[node] != self:
-                nodes[node].query()
+        # one dashboard call refreshes every node through its device
+        # subscription; like node QUERY, every driver is re-reported
+        self.discover(force=True)
 
-    def discover(self, *args, **kwargs):
+    def discover(self, *args, force=False, **kwargs):
         if self.config_state != ConfigurationState.Ready:
             LOGGER.debug("Trying to discover while not authorized")
             return False
         
-        devices = self.thinq.mqtt.thinq_client.get_devices()
-        for device in devices.items:
+        from thinq2.model.device.dishwasher import DishWasherDevice
+        from thinq2.model.device.washerdryer import WasherDryerDevice
+
+        if force:
+            for node in list(self.poly.getNodes().values()):
+                if isinstance(node, (WasherDryerNode, DishWasherNode)):
+                    node.last_forced_report = 0
+
+        # existing nodes are updated through their device subscriptions
+        devices = self.thinq.refresh_devices()
+        # model JSON downloads run on the discovery pool; nodes report from
+        # the snapshot meanwhile, so they don't wait for them
+        for future in self.thinq.prefetch_model_json(devices):
+            future.add_done_callback(self.modelJsonLoaded)
+
+        nodes = []
+        for device in devices:
             LOGGER.info("{}: {} (model {})".format(device.device_id, device.alias, device.model_name))
             
             address = self.get_valid_node_address("l{}".format(device.device_id))
@@ -218,28 +259,74 @@ class ThinQController(udi_interface.Node):
             if node is None:
                 alias = self.get_valid_node_name('LG-{}'.format(device.alias))
                 if isinstance(device.snapshot, WasherDryerDevice):
-                    self.add_node(WasherDryerNode(self.poly, self.address, address, alias, device, self.thinq))
+                    nodes.append(WasherDryerNode(self.poly, self.address, address, alias, device, self.thinq))
                 elif isinstance(device.snapshot, DishWasherDevice):
-                    self.add_node(DishWasherNode(self.poly, self.address, address, alias, device, self.thinq))
-            else:
-                node.query()
+                    nodes.append(DishWasherNode(self.poly, self.address, address, alias, device, self.thinq))
+
+        self.add_nodes(nodes)
         return True
         
-    def add_node(self,node):
-        anode = self.poly.addNode(node)
-        LOGGER.debug(f'got {anode}')
-        self.wait_for_node_done()
-        if anode is None:
-            LOGGER.error('Failed to add node address')
-        return anode
-    
-    def node_queue(self, data):
-        self.n_queue.append(data['address'])
+    def modelJsonLoaded(self, future):
+        if future.exception() is not None:
+            LOGGER.warning(f'Failed to load model JSON: {future.exception()}')
+
+    def add_node(self, node, timeout=None):
+        return self.add_nodes([node], timeout)[0]
+
+    def add_nodes(self, nodes, timeout=None):
+        """
+        Sends every addNode request up front and then waits for their
+        ADDNODEDONE events, so the nodes are added in about one round trip.
+        Returns the node (or None) per request once it is done or timed out.
+        """
+        if timeout is None:
+            timeout = self.node_add_timeout
+
+        requests = []
+        for node in nodes:
+            done = self.expect_node(node.address)
+            anode = self.poly.addNode(node)
+            LOGGER.debug(f'got {anode}')
+            if anode is None:
+                LOGGER.error('Failed to add node address')
+                self.forget_node(node.address, done)
+            requests.append((node.address, anode, done))
+
+        deadline = time.monotonic() + timeout
+        added = []
+        for address, anode, done in requests:
+            if anode is not None and not self.wait_for_node_done(
+                address, done, max(0, deadline - time.monotonic())
+            ):
+                LOGGER.warning(f'{address}: no ADDNODEDONE after {timeout}s')
+            added.append(anode)
+        return added
+
+    def expect_node(self, address):
+        """ Future resolved when Polyglot reports address as added """
+        with self.pending_nodes_lock:
+            if address not in self.pending_nodes:
+                self.pending_nodes[address] = Future()
+            return self.pending_nodes[address]
+
+    def node_done(self, data):
+        with self.pending_nodes_lock:
+            done = self.pending_nodes.pop(data['address'], None)
+        if done is not None and not done.done():
+            done.set_result(data)
+
+    def wait_for_node_done(self, address, done, timeout):
+        try:
+            done.result(timeout)
+            return True
+        except FutureTimeoutError:
+            self.forget_node(address, done)
+            return False
 
-    def wait_for_node_done(self):
-        while len(self.n_queue) == 0:
-            time.sleep(0.1)
-        self.n_queue.pop()
+    def forget_node(self, address, done):
+        with self.pending_nodes_lock:
+            if self.pending_nodes.get(address) is done:
+                del self.pending_nodes[address]
 
     def get_valid_node_address(self, deviceID):
         # Only allow utf-8 characters
@@ -298,6 +385,9 @@ class ThinQController(udi_interface.Node):
             True
         )
 
+    # seconds to wait for Polyglot to confirm a batch of addNode requests
+    node_add_timeout = 60
+
     id = 'controller'
     commands = {
         'QUERY': query,
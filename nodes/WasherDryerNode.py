@@ -1,10 +1,7 @@
-
-from thinq2.model.device.washerdryer import WasherDryerDevice
-from thinq2.controller.thinq import ThinQ
+from thinq2 import metrics
 import udi_interface
 import sys
 import time
-import urllib3
 import json
 from utils import Utilities
 
@@ -19,14 +16,18 @@ class WasherDryerNode(udi_interface.Node):
         self.thinQ = thinQ
         self.poly = polyglot
         self.lpfx = '%s:%s' % (self.id, address)
+        self.last_forced_report = 0
         
         super().__init__(polyglot, primary, address, name)
 
+        # seconds since the device produced the data this node last reported
+        metrics.registry.gauge('thinq_node_data_age_seconds', self._data_age, node=address)
+
         self.poly.subscribe(self.poly.START, self.start, address)
         self.poly.subscribe(self.poly.POLL, self.poll)
 
     def start(self):
-        self.device = self.thinQ.get_device(self.device.device_id)
+        self.device = self.thinQ.get_device(self.device.device_id, refresh=False)
         self.device.on_update(self._on_update)
         self.snapshot = self.device.snapshot
         self._reportDriver()
@@ -37,21 +38,33 @@ class WasherDryerNode(udi_interface.Node):
         self._reportDriver()
 
     def _reportDriver(self):
+        with metrics.registry.histogram('thinq_node_report_seconds', node=self.address).time():
+            self._reportState()
+
+    def _data_age(self):
+        return time.time() - self.snapshot.timestamp / 1000
+
+    def _reportState(self):
         LOGGER.debug('%s: object=%s', self.lpfx,json.dumps(self.snapshot.state))
 
-        self.setDriver('ST', 1)
+        force = time.time() - self.last_forced_report >= self.force_report_interval
+        if force:
+            self.last_forced_report = time.time()
+
+        self.setDriver('ST', 1, force=force)
         minutes = int(self.snapshot.state["remainTimeMinute"]) + (int(self.snapshot.state["remainTimeHour"]) * 60)
-        self.setDriver('GV0', minutes)
+        self.setDriver('GV0', minutes, force=force)
 
         state = self.snapshot.state["state"]
 
         if state in Utilities.state_to_gv.keys():
-            self.setDriver('GV2', Utilities.state_to_gv[state])
-        
+            self.setDriver('GV2', Utilities.state_to_gv[state], force=force)
+
     def poll(self, polltype):
         if 'longPoll' in polltype:
+            # the controller refreshes every device from one dashboard call
+            # and the update reaches this node through _on_update
             LOGGER.debug('%s: longPoll (node)', self.lpfx,)
-            self._update()
     
     def _update(self):
         try:
@@ -62,8 +75,13 @@ class WasherDryerNode(udi_interface.Node):
         
     def query(self,command=None):
         LOGGER.debug('query (node)')
+        # an explicit query re-reports every driver
+        self.last_forced_report = 0
         self._update()
 
+    # seconds between full driver refreshes, even if nothing changed
+    force_report_interval = 3600
+
     drivers = [
         {'driver': 'ST', 'value': 0, 'uom': 2},
         {'driver': 'GV0', 'value': 0, 'uom': 44}, # Time Remaining 
@@ -1,12 +1,12 @@
 #!/usr/bin/env python
 import os
-import json
 import signal
 from pprint import pprint
 
 
 from thinq2.controller.auth import ThinQAuth
 from thinq2.controller.thinq import ThinQ
+from thinq2.controller.session import SessionStore
 from thinq2.client.objectstore import ObjectStoreClient
 from thinq2.model.device.dishwasher import DishWasherDevice
 
@@ -14,9 +14,10 @@ LANGUAGE_CODE = "en-CA"
 COUNTRY_CODE = "CA"
 STATE_FILE = os.environ.get("STATE_FILE", "state.json")
 
-if os.path.exists(STATE_FILE):
-    with open(STATE_FILE, "r") as f:
-        thinq = ThinQ(json.load(f))
+session_store = SessionStore(STATE_FILE)
+
+if session_store.exists():
+    thinq = ThinQ(session_store.load())
 else:
     auth = ThinQAuth(language_code=LANGUAGE_CODE, country_code=COUNTRY_CODE)
 
@@ -35,11 +36,8 @@ else:
 
     print("\n")
 
-def save_state():
-    with open(STATE_FILE, "w") as f:
-        json.dump(vars(thinq), f)
-
-save_state()
+thinq.auth.on_token_refresh = lambda auth: session_store.save(thinq)
+session_store.save(thinq, immediate=True)
 
 devices = thinq.mqtt.thinq_client.get_devices()
 
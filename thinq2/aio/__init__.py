@@ -0,0 +1,6 @@
+""" asyncio variants of the thinq2 controllers (requires aiohttp) """
+
+from .auth import AsyncThinQAuth
+from .device import AsyncThinQDevice
+from .mqtt import AsyncThinQMQTT
+from .thinq import AsyncThinQ
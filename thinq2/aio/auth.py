@@ -0,0 +1,73 @@
+import time
+import asyncio
+
+from thinq2 import metrics
+from thinq2.aio.client import async_client
+from thinq2.client.oauth import OAuthClient
+from thinq2.controller.auth import ThinQAuth
+
+
+class AsyncThinQAuth(ThinQAuth):
+    """
+    ThinQAuth for aiohttp based clients.
+
+    uplink request templates cannot await, so an expired token surfaces as a
+    ThinQException(EMP_AUTHENTICATION_FAILED) and is refreshed by the caller
+    with `await refresh_token()`; the proactive refresh runs as a task on the
+    event loop instead of a timer thread. Login (gateway, profile, initial
+    token) is a one-off and stays on the blocking clients.
+    """
+
+    _refreshing = None
+    _refresh_task = None
+
+    def before_request(self, request):
+        self._request_started[id(request[2])] = time.perf_counter()
+        self.add_headers(*request)
+
+    def after_response(self, request, response):
+        # no 0102 retry here (see above), only the bookkeeping; login and
+        # MQTT registration still use blocking clients with requests responses
+        status = getattr(response, "status", None) or response.status_code
+        self._observe(request, status=status)
+
+    def start_token_refresh(self):
+        self.stop_token_refresh()
+        self._refresh_task = asyncio.ensure_future(self._refresh_ahead())
+
+    def stop_token_refresh(self):
+        task, self._refresh_task = self._refresh_task, None
+        if task is not None:
+            task.cancel()
+
+    async def _refresh_ahead(self):
+        while True:
+            await asyncio.sleep(self.token_refresh_delay())
+            try:
+                await self.refresh_token()
+            except Exception:
+                metrics.registry.counter("thinq_token_refresh_errors_total").inc()
+                await asyncio.sleep(self.token_refresh_retry)
+
+    async def refresh_token(self, stale_token=None):
+        """ Refreshes the token; concurrent callers share one in-flight refresh """
+        if stale_token is not None and stale_token != self.token.access_token:
+            return
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._refresh_token())
+            self._refreshing.add_done_callback(self._refresh_done)
+        await asyncio.shield(self._refreshing)
+
+    async def _refresh_token(self):
+        token = await self.async_oauth_client.refresh_token(self.token.refresh_token)
+        self.token.update(token.mark_issued())
+        metrics.registry.counter("thinq_token_refreshes_total").inc()
+        if self.on_token_refresh is not None:
+            self.on_token_refresh(self)
+
+    def _refresh_done(self, future):
+        self._refreshing = None
+
+    @property
+    def async_oauth_client(self):
+        return async_client(OAuthClient, base_url=self.oauth_backend_url)
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+from urllib.parse import urlparse
+
+try:
+    import aiohttp
+except ImportError as e:
+    raise ImportError(
+        "thinq2.aio needs the optional aiohttp package: pip install aiohttp"
+    ) from e
+from uplink import AiohttpClient
+
+from thinq2.client.base import (
+    LimitedClientMixin,
+    circuit_breakers,
+    rate_limiter,
+)
+from thinq2.util import end_with
+
+
+class AsyncSessionPool:
+    """
+    aiohttp counterpart of thinq2.client.base.SessionPool: one keep-alive
+    ClientSession per host, bound to the running event loop
+    """
+
+    def __init__(self, limit_per_host=10):
+        self.limit_per_host = limit_per_host
+        self._sessions = {}
+
+    def session(self, url):
+        """ Must be called from a coroutine, as sessions bind to the running loop """
+        loop = asyncio.get_running_loop()
+        host = urlparse(url).netloc
+        bound_loop, session = self._sessions.get(host, (None, None))
+        if bound_loop is not loop:
+            connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host)
+            session = aiohttp.ClientSession(connector=connector)
+            self._sessions[host] = (loop, session)
+        return session
+
+    async def close(self):
+        sessions, self._sessions = self._sessions, {}
+        for _, session in sessions.values():
+            await session.close()
+
+
+async_session_pool = AsyncSessionPool()
+
+
+class LimitedAiohttpClient(LimitedClientMixin, AiohttpClient):
+    """
+    aiohttp counterpart of thinq2.client.base.LimitedRequestsClient, sharing
+    its rate limiter, circuit breakers and retry policy. Waits for tokens and
+    backoff delays without blocking the event loop.
+    """
+
+    # aiohttp's counterparts of requests.ConnectionError and requests.Timeout
+    transient_errors = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+    deadline_error = asyncio.TimeoutError
+
+    async def send(self, request):
+        method, url, extras = request
+        breaker = self._breaker(method, url)
+        try:
+            response, content = await self._send(request, breaker)
+        except BaseException:
+            # whatever failed, or a half-open trial would never be settled
+            self._record(breaker)
+            raise
+        self._record(breaker, *self._outcome(response, content))
+        return response
+
+    async def _send(self, request, breaker):
+        """ Sends request, retrying transient failures as `retry` allows """
+        method = request[0]
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            delay = self.limiter.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                response = await super().send(self._prepare(request, started))
+                # read here so the timeout covers the body and the result
+                # code can be checked; aiohttp keeps it for the handlers
+                content = await response.read()
+            except (OSError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                delay = self._retry_delay(
+                    breaker, method, attempt, started, exception=e
+                )
+                if delay is None:
+                    raise
+            else:
+                status, code = self._outcome(response, content)
+                delay = self._retry_delay(
+                    breaker, method, attempt, started, status=status, code=code
+                )
+                if delay is None:
+                    return response, content
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _timeout(self, seconds):
+        return aiohttp.ClientTimeout(total=seconds)
+
+    def _retryable(self, method, status=None, code=None, exception=None):
+        if isinstance(exception, self.transient_errors):
+            return method.upper() in self.retry.methods
+        return super()._retryable(method, status, code, exception)
+
+
+def async_client(client_class, base_url=None, **kwargs):
+    """
+    Builds an uplink client whose methods return coroutines, limited like
+    the blocking clients and retried per the client class's retry_policy
+    """
+    base_url = end_with(base_url or client_class.base_url, "/")
+    if "client" not in kwargs:
+        kwargs["client"] = LimitedAiohttpClient(
+            async_session_pool.session(base_url),
+            rate_limiter,
+            circuit_breakers,
+            client_class.retry_policy,
+        )
+    return client_class(base_url=base_url, **kwargs)
@@ -0,0 +1,41 @@
+from thinq2.aio.client import async_client
+from thinq2.client.thinq import ThinQClient
+from thinq2.client.objectstore import ObjectStoreClient
+from thinq2.controller.device import ThinQDevice
+from thinq2.util import cached_property
+
+
+class AsyncThinQDevice(ThinQDevice):
+    """ ThinQDevice whose model JSON is fetched with `await load_model()` """
+
+    async def load_model(self):
+        cache = self._model_json_cache
+        document = cache.lookup(self.model_name)
+
+        if document is None:
+            descriptor = await self._thinq_client.get_model_json_descriptor(
+                device_id=self.device_id, model_name=self.model_name
+            )
+            document = cache.lookup(self.model_name, descriptor.model_json_ver)
+            if document is None:
+                document = await self._object_store_client.get_json_url(
+                    descriptor.model_json_uri
+                )
+                cache.put(self.model_name, descriptor.model_json_ver, document)
+
+        self.model_json = document
+        return document
+
+    @cached_property
+    def model_json(self):
+        raise RuntimeError("model JSON not loaded, await load_model() first")
+
+    @property
+    def _thinq_client(self):
+        return async_client(
+            ThinQClient, base_url=self._auth.gateway.thinq2_uri, auth=self._auth
+        )
+
+    @property
+    def _object_store_client(self):
+        return async_client(ObjectStoreClient)
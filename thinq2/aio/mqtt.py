@@ -0,0 +1,119 @@
+import asyncio
+
+from urllib.parse import urlparse
+
+from paho.mqtt.client import MQTT_ERR_SUCCESS
+
+from thinq2.controller.mqtt import ThinQMQTT
+
+
+class AsyncioLoopHelper:
+    """
+    Drives a paho client from an asyncio event loop instead of paho's own
+    network thread. Socket callbacks may fire from an executor thread while
+    connecting; those are handed to the loop with call_soon_threadsafe and
+    refer to the socket by its fd, as paho may have closed it by then.
+    Callbacks on the loop thread (from loop_read/loop_write) act at once.
+    """
+
+    def __init__(self, loop, client, on_close=None):
+        self.loop = loop
+        self.client = client
+        self.on_close = on_close
+        self._misc = None
+        self._fd = None
+
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self._fd = sock.fileno()
+        self._call(self._open, self._fd)
+
+    def on_socket_close(self, client, userdata, sock):
+        self._call(self._close, self._fd)
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self._call(self.loop.add_writer, self._fd, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self._call(self.loop.remove_writer, self._fd)
+
+    def _call(self, func, *args):
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+
+        if on_loop:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def _open(self, fd):
+        self.loop.add_reader(fd, self.client.loop_read)
+        self._misc = self.loop.create_task(self._misc_loop())
+
+    def _close(self, fd):
+        if self._misc is not None:
+            self._misc.cancel()
+        self.loop.remove_reader(fd)
+        self.loop.remove_writer(fd)
+        if self.on_close is not None:
+            self.on_close()
+
+    async def _misc_loop(self):
+        while self.client.loop_misc() == MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+
+class AsyncThinQMQTT(ThinQMQTT):
+    """
+    ThinQMQTT running on the asyncio event loop. Callbacks (and therefore
+    device updates) run on the loop thread.
+    """
+
+    _helper = None
+    _stopping = False
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        self._stopping = False
+
+        # route, registration and the CA cert are one-off blocking initializers
+        client = await loop.run_in_executor(None, lambda: self.client)
+        route = await loop.run_in_executor(None, lambda: self.route)
+        endpoint = urlparse(route.mqtt_server)
+
+        if self._helper is None:
+            self._helper = AsyncioLoopHelper(loop, client, self._on_socket_close)
+        await loop.run_in_executor(None, client.connect, endpoint.hostname, endpoint.port)
+
+    async def disconnect(self):
+        self._stopping = True
+        self.client.disconnect()
+
+    def _on_socket_close(self):
+        if not self._stopping:
+            self._helper.loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = self.reconnect_backoff.delay(self._reconnect_attempt)
+        self._reconnect_attempt += 1
+        self.logger.debug("thinq.mqtt reconnecting in %.1fs", delay)
+        await asyncio.sleep(delay)
+        if self._stopping:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.client.reconnect)
+        except OSError as e:
+            self.logger.debug("thinq.mqtt reconnect failed: %s", e)
+            self._on_socket_close()
+        except Exception as e:
+            self.logger.error("thinq.mqtt reconnect failed: %s", e, exc_info=True)
+            self._on_socket_close()
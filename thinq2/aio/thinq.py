@@ -0,0 +1,133 @@
+import asyncio
+
+from thinq2.aio.auth import AsyncThinQAuth
+from thinq2.aio.client import async_client, async_session_pool
+from thinq2.aio.device import AsyncThinQDevice
+from thinq2.aio.mqtt import AsyncThinQMQTT
+from thinq2.client.thinq import ThinQClient
+from thinq2.controller.thinq import ThinQ
+from thinq2.model.thinq import ThinQException, ThinQResultCode
+from thinq2.schema import controller
+from thinq2.util.throttle import CircuitOpen
+
+
+class AsyncThinQ(ThinQ):
+    """
+    asyncio variant of ThinQ: REST calls go through aiohttp and MQTT runs on
+    the event loop, so device fetches, token refreshes and message handling
+    overlap on one thread. Build it from saved state, like ThinQ.
+    """
+
+    async def get_device(self, device_id, refresh=True):
+        device = self.devices.get(device_id)
+        if device is not None and not refresh:
+            return device
+
+        try:
+            descriptor = await self._call(self.thinq_client.get_device, device_id)
+        except (CircuitOpen, ThinQException) as e:
+            # the API is throttling or failing: serve the last known snapshot
+            if device is None or not self._unavailable(e):
+                raise
+            return device
+
+        if device is None:
+            device = self.devices.add(self._create_device(descriptor))
+        else:
+            device.refresh(descriptor)
+        return device
+
+    async def get_devices(self, *device_ids, refresh=True):
+        """ Fetches several devices concurrently """
+        return await asyncio.gather(
+            *[self.get_device(device_id, refresh) for device_id in device_ids]
+        )
+
+    async def refresh_devices(self):
+        try:
+            collection = await self._call(self.thinq_client.get_devices)
+        except (CircuitOpen, ThinQException) as e:
+            if not len(self.devices) or not self._unavailable(e):
+                raise
+            return self.devices.devices()
+
+        devices = []
+        for descriptor in collection.items:
+            device = self.devices.get(descriptor.device_id)
+            if device is None:
+                device = self.devices.add(self._create_device(descriptor))
+            else:
+                device.refresh(descriptor, notify=True)
+            devices.append(device)
+        return devices
+
+    def prefetch_model_json(self, devices):
+        """ Tasks loading the model JSON of devices, one download per model """
+        return [
+            asyncio.ensure_future(self._load_models(group))
+            for group in self._group_by_model(devices)
+        ]
+
+    async def start(self, logger):
+        self.mqtt.message_filter = self._wants_message
+        self.mqtt.on_device_message = self._notify_device
+        self.mqtt.logger = logger
+        self.mqtt.on_reconnect = self._reconcile
+        await self.mqtt.connect()
+        self.auth.start_token_refresh()
+
+    async def stop(self):
+        self.auth.stop_token_refresh()
+        await self.mqtt.disconnect()
+        await async_session_pool.close()
+
+    async def _call(self, func, *args, **kwargs):
+        """ Awaits an API call, refreshing the token and retrying once if expired """
+        try:
+            return await func(*args, **kwargs)
+        except ThinQException as e:
+            if e.args[0] != ThinQResultCode.EMP_AUTHENTICATION_FAILED:
+                raise
+        await self.auth.refresh_token()
+        return await func(*args, **kwargs)
+
+    def _reconcile(self):
+        # MQTT callbacks run on the event loop
+        with self._reconcile_lock:
+            if self._reconciling:
+                return
+            self._reconciling = True
+        asyncio.ensure_future(self._reconcile_devices())
+
+    async def _reconcile_devices(self):
+        try:
+            await self.refresh_devices()
+        except Exception as e:
+            self.mqtt.logger.warning("thinq reconciliation after reconnect failed: %s", e)
+        finally:
+            self._reconciling = False
+
+    async def _load_models(self, devices):
+        for device in devices:
+            await device.load_model()
+        return devices
+
+    def _create_device(self, descriptor):
+        return AsyncThinQDevice(
+            descriptor, auth=self.auth, model_json_cache=self.model_json_cache
+        )
+
+    @property
+    def thinq_client(self):
+        # aiohttp sessions are bound to the running loop, so don't cache
+        return async_client(
+            ThinQClient, base_url=self.auth.gateway.thinq2_uri, auth=self.auth
+        )
+
+    @controller
+    def auth(self, auth):
+        return AsyncThinQAuth(auth)
+
+    @controller
+    def mqtt(self, mqtt):
+        return AsyncThinQMQTT(mqtt, auth=self.auth)
@@ -1,11 +1,322 @@
-from uplink import Consumer
+import re
+import time
+import threading
 
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from uplink import Consumer, RequestsClient
+
+from thinq2 import metrics
 from thinq2.util import end_with
+from thinq2.util.dispatch import SingleFlight
+from thinq2.util.throttle import CircuitBreaker, CircuitOpen, TokenBucket
+from thinq2.client.retry import RetryPolicy
+from thinq2.model.thinq import ThinQResultCode
+
+
+class SessionPool:
+    """
+    Keep-alive requests sessions shared by every client, one per host, so
+    each call reuses an established TLS connection instead of a new handshake
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=10):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def session(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._sessions:
+                self._sessions[host] = self._create_session()
+            return self._sessions[host]
+
+    def configure(self, pool_connections=None, pool_maxsize=None):
+        """ Changes pool sizes; existing sessions are closed and recreated lazily """
+        with self._lock:
+            self.pool_connections = pool_connections or self.pool_connections
+            self.pool_maxsize = pool_maxsize or self.pool_maxsize
+            self._close()
+
+    def add_response_hook(self, hook):
+        """ Calls hook(response, ...) for every response, in current and future sessions """
+        with self._lock:
+            self._hooks.append(hook)
+            for session in self._sessions.values():
+                session.hooks["response"].append(hook)
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.hooks["response"].extend(self._hooks)
+        return session
+
+
+session_pool = SessionPool()
+
+
+class CircuitBreakers:
+    """
+    One CircuitBreaker per endpoint (as labelled by metrics.endpoint),
+    created on first use
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint):
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(endpoint, **self.options)
+            return self._breakers[endpoint]
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._breakers.values()))
+
+
+class LimitedClientMixin:
+    """
+    Rate limiting, circuit breaking and retries around an uplink client's
+    send, shared by the blocking and asyncio clients. Each logical call is
+    let through the endpoint's breaker once and its final outcome, after any
+    retries, is recorded there once; each attempt takes a token from
+    `limiter` and times out with what is left of the retry deadline.
+    """
+
+    throttled_codes = (ThinQResultCode.EXCEEDING_LIMIT.value,)
+    failure_codes = (
+        ThinQResultCode.TIME_OUT.value,
+        ThinQResultCode.SERVICE_SERVER_ERROR.value,
+    )
+
+    # raised when the retry deadline passes before an attempt is sent
+    deadline_error = requests.Timeout
+
+    _result_code = re.compile(rb'"resultCode"\s*:\s*"(\d+)"')
+
+    def __init__(self, session, limiter, breakers, retry=None):
+        super().__init__(session)
+        self.limiter = limiter
+        self.breakers = breakers
+        self.retry = retry
+
+    def _breaker(self, method, url):
+        """ The endpoint's breaker, if it lets a call through now """
+        breaker = self.breakers.get(metrics.endpoint(url))
+        try:
+            breaker.before_call()
+        except CircuitOpen:
+            metrics.registry.counter(
+                "thinq_http_rejected_total", endpoint=breaker.name
+            ).inc()
+            raise
+        return breaker
+
+    def _prepare(self, request, started):
+        """ Request with a timeout of what is left of the retry deadline """
+        method, url, extras = request
+        if self.retry is None:
+            return request
+        # waiting for a token may have used up the rest of it
+        timeout = self.retry.timeout(started)
+        if timeout <= 0:
+            raise self.deadline_error("retry deadline passed before sending")
+        return method, url, {**extras, "timeout": self._timeout(timeout)}
+
+    def _timeout(self, seconds):
+        return seconds
+
+    def _retryable(self, method, status=None, code=None, exception=None):
+        return self.retry.retryable(method, status, code, exception)
+
+    def _retry_delay(self, breaker, method, attempt, started, **outcome):
+        """ Seconds to wait before retrying an attempt, or None to give up """
+        if self.retry is None or not self._retryable(method, **outcome):
+            return None
+        # a half-open circuit lets a single trial attempt through
+        if breaker.state != breaker.CLOSED:
+            return None
+        delay = self.retry.next_delay(attempt, started)
+        if delay is not None:
+            metrics.registry.counter(
+                "thinq_http_retries_total", endpoint=breaker.name
+            ).inc()
+        return delay
+
+    def _outcome(self, response, content=None):
+        """ HTTP status and ThinQ result code (if any) of a response """
+        status = getattr(response, "status_code", 200)
+        if content is None:
+            content = getattr(response, "content", b"")
+        match = self._result_code.search(content[:256])
+        return status, match.group(1).decode() if match else None
+
+    def _record(self, breaker, status=None, code=None):
+        """ Records the outcome of a call; no status if it raised """
+        opened = breaker.opened
+        if status is None:
+            breaker.record_failure()
+        elif status == 429 or code in self.throttled_codes:
+            breaker.record_failure(trip=True)
+        elif status >= 500 or code in self.failure_codes:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if breaker.opened != opened:
+            metrics.registry.counter(
+                "thinq_http_circuit_opened_total", endpoint=breaker.name
+            ).inc()
+
+
+class LimitedRequestsClient(LimitedClientMixin, RequestsClient):
+    """
+    RequestsClient that takes a token from `limiter` before every HTTP call
+    and guards each endpoint with a circuit breaker. Throttling responses
+    (HTTP 429, EXCEEDING_LIMIT) open the endpoint's circuit at once, server
+    errors and timeouts after a few failed calls in a row; while it is open
+    calls fail fast with CircuitOpen. Transient failures are retried as the
+    RetryPolicy `retry` allows.
+    """
+
+    def send(self, request):
+        method, url, extras = request
+        breaker = self._breaker(method, url)
+        try:
+            response = self._send(request, breaker)
+        except BaseException:
+            # whatever failed, or a half-open trial would never be settled
+            self._record(breaker)
+            raise
+        self._record(breaker, *self._outcome(response))
+        return response
+
+    def _send(self, request, breaker):
+        """ Sends request, retrying transient failures as `retry` allows """
+        method = request[0]
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                response = super().send(self._prepare(request, started))
+            except OSError as e:
+                delay = self._retry_delay(
+                    breaker, method, attempt, started, exception=e
+                )
+                if delay is None:
+                    raise
+            else:
+                status, code = self._outcome(response)
+                delay = self._retry_delay(
+                    breaker, method, attempt, started, status=status, code=code
+                )
+                if delay is None:
+                    return response
+
+            time.sleep(delay)
+            attempt += 1
+
+
+class CoalescingRequestsClient(LimitedRequestsClient):
+    """
+    LimitedRequestsClient whose concurrent identical GETs (same URL,
+    parameters and headers but volatile_headers) share one HTTP call: the
+    first caller sends it and the others get the same response. Each caller
+    still runs its own response handling.
+    """
+
+    methods = ("GET", "HEAD")
+
+    # unique per request, so left out when comparing requests
+    volatile_headers = ("x-message-id",)
+
+    def __init__(self, session, limiter, breakers, flights, retry=None):
+        super().__init__(session, limiter, breakers, retry)
+        self.flights = flights
+
+    def send(self, request):
+        method, url, extras = request
+        if method.upper() not in self.methods or any(
+            extras.get(body) is not None for body in ("data", "json", "files")
+        ):
+            return super().send(request)
+
+        send = super().send
+        return self.flights.do(self._key(method, url, extras), lambda: send(request))
+
+    def _key(self, method, url, extras):
+        headers = {
+            k: v
+            for k, v in (extras.get("headers") or {}).items()
+            if k.lower() not in self.volatile_headers
+        }
+        return (method.upper(), url, _freeze({**extras, "headers": headers}))
+
+
+def _freeze(value):
+    """ Hashable, order-independent form of request extras """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+# shared by every client instance, as clients are often built per call
+request_flights = SingleFlight()
+rate_limiter = TokenBucket(rate=5, capacity=20)
+circuit_breakers = CircuitBreakers(threshold=3, reset_timeout=30, max_timeout=600)
+retry_policy = RetryPolicy(max_attempts=4, deadline=15.0)
 
 
 class BaseClient(Consumer):
-    """ Base client class """
+    """
+    Base client class. Every HTTP call is rate limited by rate_limiter,
+    guarded by circuit_breakers and retried per `retry_policy`; subclasses
+    that set `coalesce_requests` also share concurrent identical GETs
+    through request_flights.
+    """
+
+    # opt-in, for APIs whose GETs are idempotent and whose callers tolerate
+    # sharing a response: concurrent identical GETs then cost one HTTP call
+    coalesce_requests = False
+
+    # set to None (or another RetryPolicy) per client class to change retries
+    retry_policy = retry_policy
 
     def __init__(self, base_url=None, headers={}, **kwargs):
-        super().__init__(end_with(base_url or self.base_url, "/"), **kwargs)
+        base_url = end_with(base_url or self.base_url, "/")
+        if "client" not in kwargs:
+            session = session_pool.session(base_url)
+            retry = self.retry_policy
+            if self.coalesce_requests:
+                kwargs["client"] = CoalescingRequestsClient(
+                    session, rate_limiter, circuit_breakers, request_flights, retry
+                )
+            else:
+                kwargs["client"] = LimitedRequestsClient(
+                    session, rate_limiter, circuit_breakers, retry
+                )
+        super().__init__(base_url, **kwargs)
         self.session.headers.update(headers)
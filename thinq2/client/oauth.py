@@ -5,13 +5,14 @@ import hashlib
 
 from urllib.parse import urlencode
 
-from uplink import Consumer, Field
+from uplink import Field
 from uplink import headers, form_url_encoded, get, post, response_handler
 from uplink.arguments import Header
 from uplink.decorators import inject
 from uplink.hooks import RequestAuditor
 
 import thinq2
+from thinq2.client.base import BaseClient
 from thinq2.model.auth import OAuthToken, UserProfile
 
 REDIRECT_URI = "https://kr.m.lgaccount.com/login/iabClose"
@@ -29,7 +30,7 @@ def lg_oauth_signer(request_builder):
     message = "{}\n{}".format(url, timestamp).encode("utf8")
     secret = thinq2.OAUTH_SECRET.encode("utf8")
     digest = hmac.new(secret, message, hashlib.sha1).digest()
-    signature = base64.b64encode(digest)
+    signature = base64.b64encode(digest).decode("utf8")
 
     request_builder.info["headers"].update(
         {
@@ -48,7 +49,7 @@ class BearerToken(Header):
 
 @inject(RequestAuditor(lg_oauth_signer))
 @headers({"Accept": "application/json"})
-class OAuthClient(Consumer):
+class OAuthClient(BaseClient):
     """LG ThinQ OAuth Client"""
 
     auth = {}
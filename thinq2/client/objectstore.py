@@ -8,6 +8,8 @@ class ObjectStoreClient(BaseClient):
 
     base_url = "https://objectstore.lgthinq.com"
 
+    coalesce_requests = True
+
     @returns.json
     @get
     def get_json_url(self, url: Url):
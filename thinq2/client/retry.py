@@ -0,0 +1,72 @@
+import time
+
+import requests
+
+from thinq2.model.thinq import ThinQResultCode
+from thinq2.util.backoff import Backoff
+
+
+class RetryPolicy:
+    """
+    Classifies failed calls as transient or fatal. Transient ones (device
+    response delays, operations in progress, cloud timeouts, gateway errors
+    and network errors) are retried with jittered backoff, at most
+    `max_attempts` times in all and only while the next attempt still starts
+    within `deadline` seconds of the first. Each attempt gets what is left
+    of the deadline, at most `attempt_timeout` seconds, as its timeout.
+    Only idempotent `methods` are retried; everything else, throttling
+    included, fails right away.
+    """
+
+    retryable_codes = (
+        ThinQResultCode.RESPONSE_DELAY_DEVICE.value,
+        ThinQResultCode.OPERATION_IN_PROGRESS_DEVICE.value,
+        ThinQResultCode.TIME_OUT.value,
+        ThinQResultCode.SERVICE_SERVER_ERROR.value,
+    )
+    retryable_statuses = (502, 503, 504)
+    retryable_exceptions = (requests.ConnectionError, requests.Timeout)
+
+    def __init__(
+        self,
+        max_attempts=4,
+        deadline=15.0,
+        attempt_timeout=10.0,
+        backoff=None,
+        methods=("GET", "HEAD"),
+    ):
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.backoff = backoff or Backoff(initial=0.5, maximum=5)
+        self.methods = methods
+
+    def retryable(self, method, status=None, code=None, exception=None):
+        """ Whether the outcome of a call is worth another attempt """
+        if method.upper() not in self.methods:
+            return False
+        if exception is not None:
+            return isinstance(exception, self.retryable_exceptions)
+        return status in self.retryable_statuses or code in self.retryable_codes
+
+    def next_delay(self, attempt, started):
+        """
+        Seconds to wait before retry `attempt` (counting from 0) of a call
+        first sent at `started` (time.monotonic), or None to give up
+        """
+        if attempt + 1 >= self.max_attempts:
+            return None
+        delay = self.backoff.delay(attempt)
+        if delay >= self.remaining(started):
+            return None
+        return delay
+
+    def timeout(self, started):
+        """
+        Timeout for an attempt of a call first sent at `started`; zero or
+        less once the deadline has passed
+        """
+        return min(self.attempt_timeout, self.remaining(started))
+
+    def remaining(self, started):
+        return self.deadline - (time.monotonic() - started)
@@ -15,6 +15,8 @@ from thinq2.model.thinq import (
 class ThinQClient(BaseClient):
     """LG ThinQ API client"""
 
+    coalesce_requests = True
+
     @get("service/application/dashboard")
     def get_devices(self) -> ThinQResult(DeviceCollection):
         """Retrieves collection of user's registered devices with dashboard data."""
@@ -2,6 +2,8 @@ import secrets
 import base64
 import uuid
 import re
+import time
+import threading
 import thinq2
 
 from urllib.parse import urlencode, urljoin, urlparse, parse_qs
@@ -10,16 +12,30 @@ from uplink.clients.io import RequestTemplate, transitions
 from thinq2.client.oauth import OAuthClient
 from thinq2.client.gateway import GatewayClient
 from thinq2.model.auth import ThinQSession
+from thinq2 import metrics
 from thinq2.schema import controller, initializer
+from thinq2.util import cached_property
 
 
 @controller(ThinQSession)
 class ThinQAuth(RequestTemplate):
+    # refresh this long before the token expires (capped at half its lifetime)
+    token_refresh_margin = 300
+    token_refresh_retry = 60
+
+    # called with this instance after every token refresh, eg. to persist it
+    on_token_refresh = None
+
+    _refresh_timer = None
+
     def __call__(self, request_builder):
         self._ret = request_builder.return_type
         request_builder.add_request_template(self)
 
     def before_request(self, request):
+        if self.token_expiring():
+            self.refresh_token()
+        self._request_started[id(request[2])] = time.perf_counter()
         self.add_headers(*request)
 
     def add_headers(self, method, url, extras):
@@ -27,11 +43,11 @@ class ThinQAuth(RequestTemplate):
         extras["headers"].update(self.auth_headers)
 
     def after_response(self, request, response):
+        self._observe(request, status=response.status_code)
+
         if response.status_code == 400:
             # XXX - thinq auth error - find a cleaner way of handling this
             # this gets raised when the oauth code is expired/invalid
-            # XXX - this should also die on repeated 400s for the same request
-            # (after token refresh)
             try:
                 content = response.json()
                 if content.get("resultCode") != "0102":
@@ -39,21 +55,111 @@ class ThinQAuth(RequestTemplate):
             except ValueError:
                 pass
 
-            self.refresh_token()
+            # only retry once; a second 0102 surfaces as a ThinQException
+            method, url, extras = request
+            if id(extras) in self._auth_retried:
+                self._auth_retried.discard(id(extras))
+                return
+            self._auth_retried.add(id(extras))
+
+            self.refresh_token(stale_token=extras["headers"].get("x-emp-token"))
             self.add_headers(*request)
-            return transitions.sleep(1)
+            self._request_started[id(extras)] = time.perf_counter()
+            return transitions.send(request)
+
+        self._auth_retried.discard(id(request[2]))
+
+    def after_exception(self, request, exc_type, exc_val, exc_tb):
+        self._auth_retried.discard(id(request[2]))
+        self._observe(request, status=exc_type.__name__)
+
+    def _observe(self, request, status):
+        method, url, extras = request
+        started = self._request_started.pop(id(extras), None)
+        name = metrics.endpoint(url)
+        metrics.registry.counter(
+            "thinq_http_responses_total", endpoint=name, status=status
+        ).inc()
+        if started is not None:
+            metrics.registry.histogram(
+                "thinq_http_request_seconds", method=method, endpoint=name
+            ).observe(time.perf_counter() - started)
 
     # XXX - this should throw exceptions if they fail
     def set_token(self, authorization_code):
-        self.token = self.oauth_client.get_token(authorization_code)
+        self.token = self.oauth_client.get_token(authorization_code).mark_issued()
 
     def set_token_from_url(self, url):
         params = parse_qs(urlparse(url).query)
         ## XXX - throw error if no code
         self.set_token(params["code"][0])
 
-    def refresh_token(self):
-        self.token.update(self.oauth_client.refresh_token(self.token.refresh_token))
+    def refresh_token(self, stale_token=None):
+        """
+        Refreshes the OAuth token. Concurrent callers share one refresh: a
+        caller whose token was already replaced while it waited returns
+        without refreshing again.
+        """
+        stale_token = stale_token or self.token.access_token
+        with self._refresh_lock:
+            if self.token.access_token != stale_token:
+                return
+            token = self.oauth_client.refresh_token(self.token.refresh_token)
+            self.token.update(token.mark_issued())
+            metrics.registry.counter("thinq_token_refreshes_total").inc()
+
+        if self.on_token_refresh is not None:
+            self.on_token_refresh(self)
+
+    def token_expiring(self, now=None):
+        """
+        True if the token should be refreshed before it is used again. A
+        token of unknown expiry (saved before expiry was tracked) is used as
+        is; the background refresh and the 0102 retry take care of it.
+        """
+        if self.token is None or self.token.seconds_left(now) is None:
+            return False
+        return self.token_refresh_delay(now) <= 0
+
+    def token_refresh_delay(self, now=None):
+        """ Seconds until the token should be refreshed; 0 if unknown/overdue """
+        left = self.token.seconds_left(now)
+        if left is None:
+            return 0
+        margin = min(self.token_refresh_margin, int(self.token.expires_in) / 2)
+        return max(left - margin, 0)
+
+    def start_token_refresh(self):
+        """ Refreshes the token in the background, ahead of its expiry """
+        self._schedule_refresh(self.token_refresh_delay())
+
+    def stop_token_refresh(self):
+        timer, self._refresh_timer = self._refresh_timer, None
+        if timer is not None:
+            timer.cancel()
+
+    def _schedule_refresh(self, delay):
+        self.stop_token_refresh()
+        timer = threading.Timer(delay, self._scheduled_refresh)
+        timer.name = "thinq-token-refresh"
+        timer.daemon = True
+        self._refresh_timer = timer
+        timer.start()
+
+    def _scheduled_refresh(self):
+        timer = threading.current_thread()
+        try:
+            # a token of unknown expiry is refreshed once, to learn it
+            if self.token_refresh_delay() <= 0:
+                self.refresh_token()
+            delay = max(self.token_refresh_delay(), self.token_refresh_retry)
+        except Exception:
+            metrics.registry.counter("thinq_token_refresh_errors_total").inc()
+            delay = self.token_refresh_retry
+
+        # unless stop_token_refresh() was called meanwhile
+        if self._refresh_timer is timer:
+            self._schedule_refresh(delay)
 
     @property
     def auth_headers(self):
@@ -99,6 +205,8 @@ class ThinQAuth(RequestTemplate):
 
     @property
     def oauth_backend_url(self):
+        if self.token is not None and self.token.oauth2_backend_url:
+            return self.token.oauth2_backend_url
         return "https://{}.lgeapi.com".format(self.country_code)
 
     @property
@@ -120,6 +228,18 @@ class ThinQAuth(RequestTemplate):
         id = base64.urlsafe_b64encode(uuid.uuid4().bytes).decode("UTF-8")
         return re.sub("=*$", "", id)
 
+    @cached_property
+    def _request_started(self):
+        return {}
+
+    @cached_property
+    def _auth_retried(self):
+        return set()
+
+    @cached_property
+    def _refresh_lock(self):
+        return threading.Lock()
+
     @initializer
     def client_id(self):
         return secrets.token_hex(32)
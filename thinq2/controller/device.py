@@ -1,54 +1,79 @@
-from deepmerge import Merger
+import asyncio
+import inspect
+import threading
 
-from thinq2.schema import controller
-from thinq2.util import memoize
+from thinq2 import metrics
+from thinq2.schema import controller, patch
+from thinq2.util import cached_property
 from thinq2.client.thinq import ThinQClient
 from thinq2.client.objectstore import ObjectStoreClient
-from thinq2.model.thinq import DeviceDescriptor, ModelJsonDataclass
+from thinq2.controller.modeljson import ModelJsonCache
+from thinq2.model.thinq import DeviceDescriptor, ModelJsonDecoder
 
 
 @controller(DeviceDescriptor)
 class ThinQDevice:
-    def __init__(self, auth):
+    def __init__(self, auth, model_json_cache=None):
         self._auth = auth
-        self._on_update = None
+        self._model_json_cache = model_json_cache or ModelJsonCache()
+        self._subscribers = []
+        # updates come from dispatcher workers, refreshes from polling and
+        # discovery; one at a time, so neither is lost and subscribers see
+        # a device's changes in order
+        self._lock = threading.RLock()
 
     def update(self, state):
-        schema = self.snapshot.Schema()
-        snapshot = schema.dump(self.snapshot)
-        update = self._merger.merge(snapshot, state)
-        self.snapshot = schema.load(update)
-        if self._on_update:
-            self._on_update(self)
+        """ Applies a partial (reported) snapshot, touching only the given keys """
+        with metrics.registry.histogram("thinq_device_update_seconds").time():
+            with self._lock:
+                self.snapshot = patch(self.snapshot, state)
+                self._notify()
+
+    def refresh(self, descriptor, notify=False):
+        """ Replaces device data with a freshly fetched DeviceDescriptor """
+        with self._lock:
+            self._data = descriptor
+            if notify:
+                self._notify()
 
     def on_update(self, func):
-        self._on_update = func
+        if func not in self._subscribers:
+            self._subscribers = self._subscribers + [func]
 
-    @property
-    def _merger(self):
-        return Merger([(dict, ["merge"])], ["override"], ["override"])
+    def remove_on_update(self, func):
+        self._subscribers = [f for f in self._subscribers if f != func]
+
+    def _notify(self):
+        # subscriber list is replaced, never mutated, so iterating is thread-safe
+        for func in self._subscribers:
+            result = func(self)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
 
     @property
     def state(self):
-        return self._model.Schema().load(self.snapshot.state)
+        return self._model.decode(self.snapshot.state)
 
-    @property
-    @memoize
+    @cached_property
     def model_json(self):
-        return self._object_store_client.get_json_url(self.model_json_uri)
+        return self._model_json_cache.get(
+            self.model_name,
+            self._model_json_descriptor,
+            self._object_store_client.get_json_url,
+        )
 
-    @property
-    @memoize
+    @cached_property
     def model_json_uri(self):
-        descriptor = self._thinq_client.get_model_json_descriptor(
+        return self._model_json_descriptor().model_json_uri
+
+    def _model_json_descriptor(self):
+        return self._thinq_client.get_model_json_descriptor(
             device_id=self.device_id, model_name=self.model_name
         )
-        return descriptor.model_json_uri
 
-    @property
-    @memoize
+    @cached_property
     def _model(self):
-        return ModelJsonDataclass(self.model_json).build(self.alias)
+        return ModelJsonDecoder.for_model(self.model_json)
 
     @property
     def _thinq_client(self):
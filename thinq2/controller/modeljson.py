@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from thinq2.util.filesystem import atomic_write
+
+
+class ModelJsonCache:
+    """
+    Model JSON cache shared by every device of the same model.
+
+    Entries are keyed by model name and model_json_ver. When given a path,
+    documents are stored there content-addressed (<sha256>.json) next to an
+    index.json, so they survive restarts. An entry is trusted for `max_age`
+    seconds; after that the ModelJson descriptor is fetched again and the
+    document is only downloaded if the version changed.
+    """
+
+    INDEX = "index.json"
+
+    def __init__(self, path=None, max_age=24 * 60 * 60):
+        self.path = path
+        self.max_age = max_age
+        self._documents = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+
+    def get(self, model_name, fetch_descriptor, fetch_json):
+        """
+        Returns the model JSON for model_name. fetch_descriptor() must return
+        a ModelJsonDescriptor, fetch_json(uri) the document it points to.
+        """
+        with self.lock(model_name):
+            document = self.lookup(model_name)
+            if document is not None:
+                return document
+
+            try:
+                descriptor = fetch_descriptor()
+            except Exception:
+                document = self.lookup(model_name, stale=True)
+                if document is not None:
+                    return document
+                raise
+
+            document = self.lookup(model_name, descriptor.model_json_ver)
+            if document is None:
+                document = fetch_json(descriptor.model_json_uri)
+                self.put(model_name, descriptor.model_json_ver, document)
+            return document
+
+    def lookup(self, model_name, version=None, stale=False):
+        """
+        Returns the cached document for model_name if it is still fresh, or
+        regardless of age with stale=True. Given a version, the document is
+        returned (and revalidated) only if it matches that version.
+        """
+        entry = self._index.get(model_name)
+        document = self._document(entry)
+        if document is None:
+            return None
+
+        if version is not None:
+            if entry["version"] != version:
+                return None
+            self._store_entry(model_name, version, entry["sha256"])
+            return document
+
+        if stale or not self._is_stale(entry):
+            return document
+        return None
+
+    def put(self, model_name, version, document):
+        self._store_entry(model_name, version, self._store_document(document))
+
+    def lock(self, model_name):
+        """ Per-model lock, so one model is only fetched once at a time """
+        with self._lock:
+            return self._locks.setdefault(model_name, threading.Lock())
+
+    def invalidate(self, model_name=None):
+        with self._lock:
+            if model_name is None:
+                self._index.clear()
+            else:
+                self._index.pop(model_name, None)
+            self._save_index()
+
+    def _is_stale(self, entry):
+        return time.time() - entry.get("checked", 0) > self.max_age
+
+    def _document(self, entry):
+        if entry is None:
+            return None
+
+        sha256 = entry["sha256"]
+        if sha256 not in self._documents and self.path is not None:
+            try:
+                with open(self._document_path(sha256), "r") as f:
+                    self._documents[sha256] = json.load(f)
+            except (OSError, ValueError):
+                return None
+        return self._documents.get(sha256)
+
+    def _store_document(self, document):
+        content = json.dumps(document, sort_keys=True)
+        sha256 = hashlib.sha256(content.encode("utf8")).hexdigest()
+        self._documents[sha256] = document
+
+        if self.path is not None and not os.path.exists(self._document_path(sha256)):
+            atomic_write(self._document_path(sha256), content)
+        return sha256
+
+    def _store_entry(self, model_name, version, sha256):
+        with self._lock:
+            previous = self._index.get(model_name, {}).get("sha256")
+            self._index[model_name] = dict(
+                version=version, sha256=sha256, checked=time.time()
+            )
+            self._save_index()
+
+            if previous not in (None, sha256) and not any(
+                e["sha256"] == previous for e in self._index.values()
+            ):
+                self._remove_document(previous)
+
+    def _remove_document(self, sha256):
+        self._documents.pop(sha256, None)
+        if self.path is not None:
+            try:
+                os.remove(self._document_path(sha256))
+            except OSError:
+                pass
+
+    def _document_path(self, sha256):
+        return os.path.join(self.path, "{}.json".format(sha256))
+
+    def _load_index(self):
+        if self.path is None:
+            return {}
+
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            with open(os.path.join(self.path, self.INDEX), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        if self.path is not None:
+            atomic_write(os.path.join(self.path, self.INDEX), json.dumps(self._index))
@@ -1,52 +1,148 @@
 import requests
 import ssl
+import threading
+from datetime import datetime, timezone
 from urllib.parse import urlparse
 
-from OpenSSL import crypto
-from OpenSSL.SSL import FILETYPE_PEM
-from paho.mqtt.client import Client
+from paho.mqtt.client import Client, MQTT_ERR_SUCCESS
 
-from thinq2.model.mqtt import MQTTConfiguration, MQTTMessage
+from thinq2 import metrics
+from thinq2.model.mqtt import MQTTConfiguration, MQTTMessageDecoder
 from thinq2.schema import controller, initializer
 from thinq2.client.thinq import ThinQClient
 from thinq2.client.common import CommonClient
-from thinq2.util import memoize
-from thinq2.util.filesystem import TempDir
+from thinq2.util import Cache, cached_property
+from thinq2.util.backoff import Backoff
+from thinq2.util.filesystem import ephemeral_file
 
 from thinq2 import AWS_IOTT_CA_CERT_URL, AWS_IOTT_ALPN_PROTOCOL
 
 @controller(MQTTConfiguration)
 class ThinQMQTT:
+    decoder = MQTTMessageDecoder()
+
+    # called with each parsed payload (a dict) before it is fully decoded;
+    # returning False drops the message
+    message_filter = None
+
+    # keep subscriptions (and queued QoS 1 messages) on the broker while
+    # disconnected, so a reconnect doesn't have to subscribe again
+    clean_session = False
+    reconnect_backoff = Backoff(initial=1, maximum=120)
+
+    # on_connection_change(connected) is called on every (dis)connect,
+    # on_reconnect() after each reconnect, eg. to catch up on missed updates
+    on_connection_change = None
+    on_reconnect = None
+
+    _connects = 0
+    _reconnect_attempt = 0
+    _supervisor = None
+
     def __init__(self, auth):
         self._auth = auth
 
     def connect(self):
         if not self.client.is_connected():
-            endpoint = urlparse(self.route.mqtt_server)
-            self.client.connect(endpoint.hostname, endpoint.port)
+            self._open()
+
+    def _open(self):
+        endpoint = urlparse(self.route.mqtt_server)
+        self.client.connect(endpoint.hostname, endpoint.port)
 
     def loop_start(self):
-        self.connect()
-        self.client.loop_start()
+        """ Connects and keeps reconnecting from a background thread """
+        if self._supervisor is None or not self._supervisor.is_alive():
+            self._stop_event.clear()
+            self._supervisor = threading.Thread(
+                target=self._supervise, name="thinq-mqtt", daemon=True
+            )
+            self._supervisor.start()
 
     def loop_forever(self):
-        self.connect()
-        self.client.loop_forever()
+        self._stop_event.clear()
+        self._supervise()
+
+    def loop_stop(self, timeout=None):
+        self._stop_event.set()
+        self.client.disconnect()
+        if self._supervisor is not None:
+            self._supervisor.join(timeout)
+
+    def _supervise(self):
+        """
+        Runs the network loop, reconnecting with jittered exponential
+        backoff until loop_stop. The backoff restarts once the broker
+        accepts a connection.
+        """
+        reconnect = False
+        while not self._stop_event.is_set():
+            try:
+                # paho still reports a dropped connection as connected, so
+                # only the first attempt may find one already open
+                self._open() if reconnect else self.connect()
+            except OSError as e:
+                self.logger.debug("thinq.mqtt connect failed: %s", e)
+                self._notify_connection(False)
+            except Exception as e:
+                # registration, route or TLS setup failed (eg. throttled or
+                # an unexpected response); keep retrying like a connect error
+                self.logger.error("thinq.mqtt connect failed: %s", e, exc_info=True)
+                self._notify_connection(False)
+            else:
+                rc = MQTT_ERR_SUCCESS
+                while rc == MQTT_ERR_SUCCESS and not self._stop_event.is_set():
+                    rc = self.client.loop(timeout=1.0)
+
+            reconnect = True
+            if not self._stop_event.is_set():
+                delay = self.reconnect_backoff.delay(self._reconnect_attempt)
+                self._reconnect_attempt += 1
+                self.logger.debug("thinq.mqtt reconnecting in %.1fs", delay)
+                self._stop_event.wait(delay)
+
+    @cached_property
+    def _stop_event(self):
+        return threading.Event()
 
     def on_message(self, client, userdata, msg):
         self._on_message(client, userdata, msg)
 
     def on_connect(self, client, userdata, flags, rc):
         self.logger.debug('thinq.mqtt on_connect')
-        for topic in self.registration.subscriptions:
-            client.subscribe(topic, 1)
+        metrics.registry.counter("thinq_mqtt_connects_total", rc=rc).inc()
+        if rc != 0:
+            return
+
+        self._reconnect_attempt = 0
+        if self.clean_session or not flags.get("session present"):
+            for topic in self.registration.subscriptions:
+                client.subscribe(topic, 1)
+        else:
+            self.logger.debug("thinq.mqtt session resumed, subscriptions kept")
+
+        self._connects += 1
+        self._notify_connection(True)
+        if self._connects > 1 and self.on_reconnect is not None:
+            self.on_reconnect()
 
     def on_disconnect(self, client, userdata, rc, properties=None):
+        metrics.registry.counter("thinq_mqtt_disconnects_total", rc=rc).inc()
         if rc != 0:
             self.logger.debug(
                 "thinq.mqtt Unexpected disconnection. Trying reconnect. rc: {}".format(rc))
         else:
             self.logger.debug("thinq.mqtt Graceful disconnection.")
+        self._notify_connection(False)
+
+    def _notify_connection(self, connected):
+        metrics.registry.gauge("thinq_mqtt_connected").set(int(connected))
+        if self.on_connection_change is not None:
+            self.on_connection_change(connected)
+
+    @property
+    def connected(self):
+        return self.client.is_connected()
 
     def on_device_message(self, message):
         pass
@@ -55,12 +151,31 @@ class ThinQMQTT:
         # XXX - nastiness
         message = None
         try:
-            message = MQTTMessage.Schema().loads(msg.payload)
+            with metrics.registry.histogram("thinq_mqtt_decode_seconds").time():
+                data = self.decoder.parse(msg.payload)
+                if self.message_filter is not None and not self.message_filter(data):
+                    metrics.registry.counter("thinq_mqtt_filtered_total").inc()
+                    return
+                message = self.decoder.decode(data)
             self.logger.debug('thinq.mqtt message=%s', msg.payload)
         except Exception as e:
+            metrics.registry.counter("thinq_mqtt_decode_errors_total").inc()
             self.logger.debug('thinq.mqtt Can\'t parse MQTT message: ', e)
+        else:
+            self._observe_message(message)
         self.on_device_message(message)
 
+    def _observe_message(self, message):
+        metrics.registry.counter(
+            "thinq_mqtt_messages_total", device_id=message.device_id
+        ).inc()
+        if isinstance(message.timestamp, datetime):
+            timestamp = message.timestamp
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            lag = (datetime.now(timezone.utc) - timestamp).total_seconds()
+            metrics.registry.histogram("thinq_mqtt_message_lag_seconds").observe(lag)
+
     def on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
         self.logger.debug(
             "thinq.mqtt Subscribed Succesfully for Message ID: {} - QoS: {}".format(str(mid), str(granted_qos)))
@@ -68,10 +183,9 @@ class ThinQMQTT:
     def on_log(self, client, userdata, level, buf):
         self.logger.debug('thinq.mqtt log %s: ', buf)
 
-    @property
-    @memoize
+    @cached_property
     def client(self):
-        client = Client(client_id=self._auth.client_id)
+        client = Client(client_id=self._auth.client_id, clean_session=self.clean_session)
         client.tls_set_context(self.ssl_context)
         client.on_connect = self.on_connect
         client.on_message = self.on_message
@@ -80,43 +194,55 @@ class ThinQMQTT:
         client.on_log = self.on_log
         return client
 
-    @property
-    @memoize
+    @cached_property
     def thinq_client(self):
         return ThinQClient(base_url=self._auth.gateway.thinq2_uri, auth=self._auth)
 
-    @property
-    @memoize
+    @cached_property
     def common_client(self):
         return CommonClient(auth=self._auth)
 
     @property
     def ssl_context(self):
-        temp_dir = TempDir()
-        ca_cert_path = temp_dir.file(self.ca_cert)
-        private_key_path = temp_dir.file(self.private_key)
-        client_cert_path = temp_dir.file(self.registration.certificate_pem)
+        """ TLS context for the broker, rebuilt only when the key material changes """
+        key = (self.ca_cert, self.private_key, self.registration.certificate_pem)
+        return self._ssl_contexts.get_or_set(key, lambda: self._create_ssl_context(*key))
 
+    def _create_ssl_context(self, ca_cert, private_key, certificate_pem):
         context = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH)
-        # context = ssl.create_default_context(purpose=ssl.Purpose.CLIENT_AUTH)
         context.set_alpn_protocols([AWS_IOTT_ALPN_PROTOCOL])
-        context.load_verify_locations(cafile=ca_cert_path)
-        context.load_cert_chain(certfile=client_cert_path, keyfile=private_key_path)
+        context.load_verify_locations(cadata=ca_cert)
+
+        # ssl can only load a certificate chain from files
+        with ephemeral_file(certificate_pem) as certfile:
+            with ephemeral_file(private_key) as keyfile:
+                context.load_cert_chain(certfile=certfile, keyfile=keyfile)
 
         return context
 
+    @cached_property
+    def _ssl_contexts(self):
+        return Cache(maxsize=1)
+
     @initializer
     def ca_cert(self):
         return requests.get(AWS_IOTT_CA_CERT_URL).text
 
     @initializer
     def private_key(self):
+        # pyOpenSSL is slow to import and only needed once, to register
+        from OpenSSL import crypto
+        from OpenSSL.SSL import FILETYPE_PEM
+
         key = crypto.PKey()
         key.generate_key(crypto.TYPE_RSA, 2048)
         return str(crypto.dump_privatekey(FILETYPE_PEM, key), "utf8")
 
     @initializer
     def csr(self):
+        from OpenSSL import crypto
+        from OpenSSL.SSL import FILETYPE_PEM
+
         key = crypto.load_privatekey(FILETYPE_PEM, self.private_key)
         csr = crypto.X509Req()
         csr.get_subject().CN = "AWS IoT Certificate"
@@ -0,0 +1,37 @@
+import threading
+
+
+class DeviceRegistry:
+    """
+    Thread-safe index of ThinQDevice instances keyed by device_id.
+
+    Holds exactly one device object per device_id so that MQTT dispatch
+    (from paho's network thread) and polling (from the poll thread) always
+    operate on the same instance.
+    """
+
+    def __init__(self):
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def get(self, device_id):
+        return self._devices.get(device_id)
+
+    def add(self, device):
+        """ Registers a device, returning the already registered instance if any """
+        with self._lock:
+            return self._devices.setdefault(device.device_id, device)
+
+    def remove(self, device_id):
+        with self._lock:
+            return self._devices.pop(device_id, None)
+
+    def devices(self):
+        with self._lock:
+            return list(self._devices.values())
+
+    def __contains__(self, device_id):
+        return device_id in self._devices
+
+    def __len__(self):
+        return len(self._devices)
@@ -0,0 +1,75 @@
+import os
+import json
+import threading
+
+from thinq2.util.filesystem import atomic_write
+
+
+class SessionStore:
+    """
+    Persists a ThinQ session (vars(thinq), ie. its ThinQConfiguration) as JSON.
+
+    Writes are atomic and only happen when the state actually changed since it
+    was last loaded or written. Saves are debounced: a burst of them within
+    `delay` seconds results in a single write of the latest state.
+    """
+
+    def __init__(self, path, delay=2.0):
+        self.path = path
+        self.delay = delay
+        self._written = None
+        self._pending = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """ Returns the saved session state, or None if there is none """
+        try:
+            with open(self.path, "r") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+
+        state = json.loads(content)
+        with self._lock:
+            self._written = self._serialize(state)
+        return state
+
+    def save(self, state, immediate=False):
+        """ Saves state (a ThinQ or its vars()) after `delay`, or right away """
+        content = self._serialize(state if isinstance(state, dict) else vars(state))
+        with self._lock:
+            if self._pending is None and content == self._written:
+                return
+            self._pending = content
+            if not immediate and self.delay > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.delay, self.flush)
+                    self._timer.name = "thinq-session-store"
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """ Writes any pending state now; returns True if the file was written """
+        with self._lock:
+            content, self._pending = self._pending, None
+            timer, self._timer = self._timer, None
+            if timer is not None:
+                timer.cancel()
+            if content is None or content == self._written:
+                return False
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            atomic_write(self.path, content)
+            self._written = content
+            return True
+
+    def _serialize(self, state):
+        return json.dumps(state, sort_keys=True)
@@ -1,34 +1,221 @@
-from thinq2.schema import controller
-from thinq2.util import memoize
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from thinq2 import metrics
+from thinq2.schema import controller, deep_merge
+from thinq2.util import cached_property, invalidate
+from thinq2.util.dispatch import CoalescingDispatcher
+from thinq2.util.throttle import CircuitOpen
+from thinq2.client.base import request_flights
 from thinq2.client.thinq import ThinQClient
 from thinq2.controller.mqtt import ThinQMQTT
 from thinq2.controller.auth import ThinQAuth
 from thinq2.controller.device import ThinQDevice
+from thinq2.controller.registry import DeviceRegistry
+from thinq2.controller.modeljson import ModelJsonCache
 from thinq2.model.config import ThinQConfiguration
 from thinq2.model.mqtt import MQTTMessage
+from thinq2.model.thinq import ThinQException, ThinQResultCode
 
 @controller(ThinQConfiguration)
 class ThinQ:
+    dispatch_workers = 2
+    dispatch_max_pending = 256
+    discovery_workers = 4
+
+    # MQTT message types to handle (eg. ("monitoring",)); None handles every type
+    message_types = None
+
+    # result codes for which the last known device state is served instead
+    unavailable_codes = (
+        ThinQResultCode.EXCEEDING_LIMIT,
+        ThinQResultCode.TIME_OUT,
+        ThinQResultCode.SERVICE_SERVER_ERROR,
+    )
 
-    _devices = []
+    _reconciling = False
 
-    def get_device(self, device_id):
-        device = ThinQDevice(self.thinq_client.get_device(device_id), auth=self.auth)
-        self._devices.append(device)
+    def get_device(self, device_id, refresh=True):
+        """
+        Fetches a device from the API, refreshing and returning the already
+        registered instance for that device_id if there is one. With
+        refresh=False a registered device is returned without an API call.
+        """
+        device = self.devices.get(device_id)
+        if device is not None and not refresh:
+            return device
+
+        try:
+            descriptor = self.thinq_client.get_device(device_id)
+        except (CircuitOpen, ThinQException) as e:
+            # the API is throttling or failing: serve the last known snapshot
+            if device is None or not self._unavailable(e):
+                raise
+            return device
+
+        if device is None:
+            device = self.devices.add(self._create_device(descriptor))
+        else:
+            device.refresh(descriptor)
         return device
 
+    def refresh_devices(self):
+        """
+        Refreshes the whole fleet from a single dashboard call: registered
+        devices are updated (notifying their subscribers), new ones are
+        registered. Returns the devices in dashboard order, or the registered
+        devices as they are while the dashboard's circuit is open.
+        """
+        try:
+            collection = self.thinq_client.get_devices()
+        except (CircuitOpen, ThinQException) as e:
+            if not len(self.devices) or not self._unavailable(e):
+                raise
+            return self.devices.devices()
+
+        devices = []
+        for descriptor in collection.items:
+            device = self.devices.get(descriptor.device_id)
+            if device is None:
+                device = self.devices.add(self._create_device(descriptor))
+            else:
+                device.refresh(descriptor, notify=True)
+            devices.append(device)
+        return devices
+
+    def prefetch_model_json(self, devices):
+        """
+        Loads the model JSON of devices on the discovery pool, one task per
+        model so a model is downloaded once. Returns the futures.
+        """
+        return [
+            self.discovery_pool.submit(self._load_models, group)
+            for group in self._group_by_model(devices)
+        ]
+
+    def _unavailable(self, e):
+        """ Whether e means the API is throttling or failing, not a bad request """
+        return isinstance(e, CircuitOpen) or (
+            isinstance(e, ThinQException) and e.args[0] in self.unavailable_codes
+        )
+
+    def remove_device(self, device_id):
+        return self.devices.remove(device_id)
+
     def start(self, logger):
-        self.mqtt.on_device_message = self._notify_device
+        dispatcher = self.dispatcher
+        metrics.registry.gauge("thinq_dispatch_queue_depth", lambda: dispatcher.depth)
+        metrics.registry.gauge(
+            "thinq_dispatch_coalesced_total", lambda: dispatcher.coalesced
+        )
+        metrics.registry.gauge("thinq_dispatch_dropped_total", lambda: dispatcher.dropped)
+        metrics.registry.gauge(
+            "thinq_http_coalesced_total", lambda: request_flights.shared
+        )
+        dispatcher.logger = logger
+        self.mqtt.message_filter = self._wants_message
+        self.mqtt.on_device_message = self._queue_device_message
         self.mqtt.logger = logger
+        self.mqtt.on_reconnect = self._reconcile
         self.mqtt.loop_start()
+        self.auth.start_token_refresh()
+
+    def stop(self):
+        self.auth.stop_token_refresh()
+        self.mqtt.loop_stop()
+        self.dispatcher.stop()
+        self.discovery_pool.shutdown(wait=False)
+        invalidate(self, "discovery_pool")
+
+    def _wants_message(self, data):
+        """ Peeks at a parsed payload, so other devices' chatter is never decoded """
+        return data.get("deviceId") in self.devices and (
+            self.message_types is None or data.get("type") in self.message_types
+        )
+
+    def _queue_device_message(self, message: MQTTMessage):
+        """ Runs on paho's network thread, so only queue the update """
+        if message is not None and message.device_id in self.devices:
+            self.dispatcher.submit(message.device_id, message.data.state.reported)
 
     def _notify_device(self, message: MQTTMessage):
-        for device in self._devices:
-            if device.device_id == message.device_id:
-                device.update(message.data.state.reported)
+        self._update_device(message.device_id, message.data.state.reported)
+
+    def _update_device(self, device_id, reported):
+        device = self.devices.get(device_id)
+        if device is not None:
+            device.update(reported)
+
+    def _reconcile(self):
+        """
+        Catches up on updates missed while MQTT was disconnected with one
+        dashboard refresh; called on paho's thread, so the refresh runs on the
+        discovery pool and reconnects during a refresh don't queue another.
+        """
+        with self._reconcile_lock:
+            if self._reconciling:
+                return
+            self._reconciling = True
+        self.discovery_pool.submit(self._reconcile_devices)
+
+    def _reconcile_devices(self):
+        try:
+            self.refresh_devices()
+        except Exception as e:
+            self.mqtt.logger.warning("thinq reconciliation after reconnect failed: %s", e)
+        finally:
+            self._reconciling = False
+
+    @staticmethod
+    def _group_by_model(devices):
+        groups = {}
+        for device in devices:
+            groups.setdefault(device.model_name, []).append(device)
+        return list(groups.values())
+
+    def _load_models(self, devices):
+        # the first device fetches, the others are served from the cache
+        for device in devices:
+            device._model
+        return devices
+
+    def _create_device(self, descriptor):
+        return ThinQDevice(
+            descriptor, auth=self.auth, model_json_cache=self.model_json_cache
+        )
+
+    @cached_property
+    def devices(self):
+        return DeviceRegistry()
+
+    @cached_property
+    def dispatcher(self):
+        """ Pending updates of one device are merged, so bursts collapse """
+        return CoalescingDispatcher(
+            self._update_device,
+            workers=self.dispatch_workers,
+            max_pending=self.dispatch_max_pending,
+            merge=deep_merge,
+        )
+
+    @cached_property
+    def _reconcile_lock(self):
+        return threading.Lock()
+
+    @cached_property
+    def discovery_pool(self):
+        """ Bounded pool for discovery I/O such as model JSON downloads """
+        return ThreadPoolExecutor(
+            max_workers=self.discovery_workers, thread_name_prefix="thinq-discovery"
+        )
+
+    @cached_property
+    def model_json_cache(self):
+        """ In-memory by default; assign a ModelJsonCache(path) to persist it """
+        return ModelJsonCache()
 
-    @property
-    @memoize
+    @cached_property
     def thinq_client(self):
         return ThinQClient(base_url=self.auth.gateway.thinq2_uri, auth=self.auth)
 
@@ -0,0 +1,215 @@
+import re
+import time
+import bisect
+import threading
+
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name):
+        yield name, {}, self.value
+
+
+class Gauge:
+    """ Either set explicitly or computed by `func` whenever it is read """
+
+    def __init__(self, func=None):
+        self.func = func
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        return self.func() if self.func is not None else self._value
+
+    def samples(self, name):
+        yield name, {}, self.value
+
+
+class Histogram:
+    """ Cumulative bucket histogram with count and sum, like Prometheus' """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def quantile(self, q):
+        """ Upper bound of the bucket holding the q-quantile """
+        with self._lock:
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                seen += count
+                if count and seen >= rank:
+                    return bound
+        return 0.0
+
+    def samples(self, name):
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            yield name + "_bucket", {"le": _format_bound(bound)}, seen
+        yield name + "_count", {}, self.count
+        yield name + "_sum", {}, self.sum
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(k, v.replace('"', '\\"'))
+        for k, v in sorted(labels.items())
+    )
+    return "{" + pairs + "}"
+
+
+class MetricsRegistry:
+    """
+    Process-wide set of named, labelled metrics. Metrics are created on first
+    use, so instrumented code just asks for `registry.counter(name, **labels)`.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, **labels):
+        return self._get(Counter, name, labels)
+
+    def gauge(self, name, func=None, **labels):
+        gauge = self._get(Gauge, name, labels)
+        if func is not None:
+            gauge.func = func
+        return gauge
+
+    def histogram(self, name, **labels):
+        return self._get(Histogram, name, labels)
+
+    def remove(self, name, **labels):
+        with self._lock:
+            key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+            self._metrics.pop(key, None)
+
+    def _get(self, metric_class, name, labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(key, metric_class())
+        return metric
+
+    def render(self):
+        """ Text exposition in the Prometheus format """
+        lines = []
+        with self._lock:
+            metrics = sorted(self._metrics.items(), key=lambda item: item[0])
+        for (name, labels), metric in metrics:
+            for sample, extra, value in metric.samples(name):
+                sample_labels = _format_labels({**dict(labels), **extra})
+                lines.append("{}{} {}".format(sample, sample_labels, value))
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """ One-line digest for periodic logging """
+        parts = []
+        with self._lock:
+            metrics = sorted(self._metrics.items(), key=lambda item: item[0])
+        for (name, labels), metric in metrics:
+            label = name + _format_labels(dict(labels))
+            if isinstance(metric, Histogram):
+                if metric.count:
+                    average = metric.sum / metric.count
+                    parts.append(
+                        "{} n={} avg={:.3f}s p95<={}s".format(
+                            label, metric.count, average, metric.quantile(0.95)
+                        )
+                    )
+            else:
+                parts.append("{}={}".format(label, metric.value))
+        return "; ".join(parts)
+
+
+registry = MetricsRegistry()
+
+
+class MetricsServer:
+    """ Serves registry.render() as text/plain on a local HTTP port """
+
+    def __init__(self, metrics=registry, host="127.0.0.1", port=9464):
+        # http.server is only imported by processes that actually serve metrics
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics_registry = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics_registry.render().encode("utf8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="thinq-metrics", daemon=True
+        )
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[0-9a-fA-F-]{8,}$|^\d+$")
+
+
+def endpoint(url):
+    """ URL path with ids replaced, usable as a low-cardinality label """
+    path = urlparse(url).path
+    return "/".join(":id" if _ID_SEGMENT.match(s) else s for s in path.split("/"))
@@ -1,3 +1,5 @@
+import time
+
 from marshmallow_dataclass import dataclass
 
 from thinq2.model.gateway import Gateway
@@ -10,10 +12,23 @@ class OAuthToken:
     expires_in: str
     oauth2_backend_url: str = None
     refresh_token: str = None
+    expires_at: float = None
 
     def update(self, token: "OAuthToken"):
         self.access_token = token.access_token
         self.expires_in = token.expires_in
+        self.expires_at = token.expires_at
+
+    def mark_issued(self, now=None):
+        """ Starts the expires_in clock for a token just received """
+        self.expires_at = (now or time.time()) + int(self.expires_in)
+        return self
+
+    def seconds_left(self, now=None):
+        """ Seconds until expiry, or None if it is not known """
+        if self.expires_at is None:
+            return None
+        return self.expires_at - (now or time.time())
 
 
 @dataclass(base_schema=CamelIDSchema)
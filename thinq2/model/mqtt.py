@@ -1,3 +1,5 @@
+import json
+
 from datetime import datetime
 from dataclasses import field
 
@@ -6,6 +8,12 @@ from marshmallow_dataclass import dataclass
 from thinq2.model.common import Route
 from thinq2.model.thinq import IOTRegistration
 from thinq2.schema import CamelCaseSchema
+from thinq2.util import cached_property
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 
 @dataclass
@@ -34,3 +42,59 @@ class MQTTMessage:
     message_type: str = field(metadata=dict(data_key="type"))
     data: MQTTMessageDeviceData
     timestamp: datetime = None
+
+
+class MQTTMessageDecoder:
+    """
+    Decodes MQTT payloads in two steps: parse() only parses the JSON, so
+    callers can look at deviceId/type and drop a message cheaply; decode()
+    builds the MQTTMessage directly for well-formed payloads and leaves
+    anything else to the (shared) marshmallow schema for validation.
+    """
+
+    @cached_property
+    def schema(self):
+        return MQTTMessage.Schema()
+
+    def parse(self, payload):
+        data = json_loads(payload)
+        if not isinstance(data, dict):
+            raise ValueError("MQTT payload is not a JSON object")
+        return data
+
+    def decode(self, data):
+        try:
+            return self._decode(data)
+        except (KeyError, TypeError, ValueError):
+            return self.schema.load(data)
+
+    def loads(self, payload):
+        return self.decode(self.parse(payload))
+
+    def _decode(self, data):
+        device_id = data["deviceId"]
+        message_type = data["type"]
+        state = data["data"]["state"]
+        desired = state.get("desired", {})
+        reported = state.get("reported", {})
+        timestamp = data.get("timestamp")
+
+        if not (
+            isinstance(device_id, str)
+            and isinstance(message_type, str)
+            and isinstance(desired, dict)
+            and isinstance(reported, dict)
+            and state.keys() <= {"desired", "reported"}
+        ):
+            raise TypeError("unexpected MQTT message layout")
+        if timestamp is not None:
+            timestamp = datetime.fromisoformat(timestamp)
+
+        return MQTTMessage(
+            device_id=device_id,
+            message_type=message_type,
+            data=MQTTMessageDeviceData(
+                state=MQTTMessageDeviceState(desired=desired, reported=reported)
+            ),
+            timestamp=timestamp,
+        )
@@ -1,3 +1,6 @@
+import json
+import hashlib
+
 from enum import Enum
 from dataclasses import field, make_dataclass
 from typing import List
@@ -12,7 +15,7 @@ from inflection import underscore, camelize
 
 from thinq2.schema import CamelCaseSchema, BaseSchema
 from thinq2.model.device import Device, device_types
-from thinq2.util import memoize
+from thinq2.util import Cache, cached_property
 
 
 @dataclass(base_schema=CamelCaseSchema)
@@ -178,13 +181,13 @@ class ThinQResultSuccess(BaseThinQResult):
 
 class ThinQResult(BaseThinQResult):
     def __init__(self, result_class):
-        self._result_schema = result_class.Schema()
+        self._result_class = result_class
         super().__init__()
 
     def on_bind_field(self, field_name, field):
         if isinstance(field, fields.Nested):
-            # field = fields.Str()
-            field.nested = self._result_schema
+            # resolved on first load, so client classes don't build schemas at import
+            field.nested = lambda: self._result_class.Schema()
 
     @post_load
     def unwrap_result(self, data, **kwargs):
@@ -246,21 +249,83 @@ class ModelJsonDataclass:
     def _enum_field(self, name, values):
         return Enum(camelize(name), values)
 
-    @property
-    @memoize
+    @cached_property
     def fields(self):
         return [
             self._field_definition(data_key, spec)
             for data_key, spec in self.model["MonitoringValue"].items()
         ]
 
-    @property
-    @memoize
+    @cached_property
     def enums(self):
         return {
             name: field for name, field, _ in self.fields if issubclass(field, Enum)
         }
 
+    @cached_property
+    def types(self):
+        return {name: field for name, field, _ in self.fields}
+
     @property
     def model_type(self):
         return self.model.get("Info", {"modelType": "UnknownDevice"}).get("modelType")
+
+    @property
+    def model_name(self):
+        return self.model.get("Info", {}).get("modelName") or self.model_type
+
+
+def _to_int(value):
+    # mirrors marshmallow's (non-strict) Integer field
+    if isinstance(value, bool):
+        raise TypeError("bool is not a valid integer")
+    return int(value)
+
+
+class ModelJsonDecoder:
+    """
+    Compiled decoder for a modeljson, shared process-wide by every device of
+    the same model (keyed by model name and version).
+
+    Decoding is a dictionary lookup per field; anything unexpected falls back
+    to the marshmallow schema so validation errors are reported as usual.
+    """
+
+    _registry = Cache(maxsize=32)
+
+    def __init__(self, model):
+        builder = ModelJsonDataclass(model)
+        self.dataclass = builder.build(builder.model_name)
+        self.schema = self.dataclass.Schema()
+        self._converters = {
+            field.data_key: (name, self._converter(builder.types[name]))
+            for name, field in self.schema.fields.items()
+        }
+
+    @classmethod
+    def for_model(cls, model):
+        return cls._registry.get_or_set(cls.model_key(model), lambda: cls(model))
+
+    @staticmethod
+    def model_key(model):
+        info = model.get("Info", {})
+        if "modelName" in info and "version" in info:
+            return (info["modelName"], info["version"])
+
+        content = json.dumps(model, sort_keys=True).encode("utf8")
+        return hashlib.sha256(content).hexdigest()
+
+    def decode(self, state):
+        try:
+            values = {
+                name: convert(state[data_key])
+                for data_key, (name, convert) in self._converters.items()
+            }
+        except (KeyError, TypeError, ValueError):
+            return self.schema.load(state)
+        return self.dataclass(**values)
+
+    def _converter(self, field_type):
+        if issubclass(field_type, Enum):
+            return field_type.__members__.__getitem__
+        return _to_int
@@ -1,13 +1,13 @@
 import re
 import inspect
 
-from dataclasses import is_dataclass
+from dataclasses import fields, is_dataclass, replace
 
 from attrdict import AttrDict
 from marshmallow import EXCLUDE, Schema
 from inflection import camelize
 
-from thinq2.util import memoize
+from thinq2.util import cached_property, memoize
 
 
 class BaseSchema(Schema):
@@ -36,10 +36,31 @@ class AbstractController:
     pass
 
 
+def _init_params(cls):
+    """ Names that cls.__init__ accepts as keywords """
+    params = list(inspect.signature(cls.__init__).parameters.values())[1:]
+    return frozenset(
+        p.name for p in params if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)
+    )
+
+
+def _field_property(name):
+    """ Direct accessor for dataclass field `name` of a controller's _data """
+
+    def fget(self):
+        return getattr(self._data, name)
+
+    def fset(self, value):
+        setattr(self._data, name, value)
+
+    return property(fget, fset, doc="{} of the controller data".format(name))
+
+
 def controller_class(data_type, **children):
-    schema = data_type.Schema()
+    field_names = frozenset(f.name for f in fields(data_type))
 
     def merge_args(self, kwargs):
+        schema = data_schema(data_type)
         attrs = {
             k: getattr(self, k, None) for k in schema.fields.keys() if not k in kwargs
         }
@@ -48,44 +69,39 @@ def controller_class(data_type, **children):
 
     class Controller(AbstractController):
         _data: data_type = None
+        _init_params = frozenset()
 
         # XXX - fix infinite recursion error if called w/ no args
         def __init__(self, data=None, *args, **kwargs):
-            init = inspect.signature(super().__init__)
-            pass_keys = AttrDict(
-                filter(self._param_filter, init.parameters.items())
-            ).keys()
+            pass_keys = self._init_params
             pass_params = {k: v for k, v in kwargs.items() if k in pass_keys}
 
             super().__init__(**pass_params)
 
             if data is None:
                 self._data = AttrDict(kwargs)
-                args = AttrDict(filter(self._args_filter, kwargs.items()))
-                self._data = schema.load(merge_args(self, args))
+                args = {
+                    k: v
+                    for k, v in kwargs.items()
+                    if not isinstance(v, AbstractController)
+                }
+                self._data = data_schema(data_type).load(merge_args(self, args))
             else:
                 if is_dataclass(data):
                     self._data = data
                 else:
-                    self._data = schema.load(data)
-
-        def _args_filter(self, item):
-            key, value = item
-            return not isinstance(value, AbstractController)
-
-        def _param_filter(self, item):
-            name, param = item
-            return param.kind in [param.POSITIONAL_OR_KEYWORD, param.KEYWORD_ONLY]
+                    self._data = data_schema(data_type).load(data)
 
         @classmethod
         def load(cls, data):
-            return cls(schema.load(data))
+            return cls(data_schema(data_type).load(data))
 
         @property
         def __dict__(self):
-            return schema.dump(self._data)
-
+            return data_schema(data_type).dump(self._data)
 
+        # schema fields are class properties (see class_wrapper), so this is
+        # only reached for other attributes of _data and during __init__
         # XXX - should throw attribute exception if attr not in schema
         def __getattr__(self, attr):
             if not attr.startswith("_"):
@@ -96,13 +112,33 @@ def controller_class(data_type, **children):
             return super().__getattr__(attr)
 
         def __setattr__(self, attr, value):
-            if isinstance(self._data, data_type) and hasattr(self._data, attr):
+            if attr in field_names:
+                if isinstance(self._data, data_type):
+                    setattr(self._data, attr, value)
+                    return
+            elif (
+                not attr.startswith("_")
+                and isinstance(self._data, data_type)
+                and hasattr(self._data, attr)
+            ):
                 setattr(self._data, attr, value)
-            else:
-                super().__setattr__(attr, value)
+                return
+            super().__setattr__(attr, value)
 
     def class_wrapper(base_class):
-        return type(base_class.__name__, (Controller, base_class), {})
+        """
+        Builds the controller class once: the base __init__ parameters are
+        resolved up front and every schema field not already defined on
+        base_class (eg. by @initializer or @controller) gets a property, so
+        neither construction nor attribute access needs reflection.
+        """
+        namespace = {
+            name: _field_property(name)
+            for name in field_names
+            if not hasattr(base_class, name) and not hasattr(Controller, name)
+        }
+        namespace["_init_params"] = _init_params(base_class)
+        return type(base_class.__name__, (Controller, base_class), namespace)
 
     return class_wrapper
 
@@ -110,9 +146,8 @@ def controller_class(data_type, **children):
 def controller_factory(func):
     field_name = func.__name__
 
-    @property
-    @memoize
-    def inner(self, *args, **kwargs):
+    @cached_property
+    def inner(self):
         if isinstance(self._data, dict):
             existing = self._data.get(field_name, None)
         else:
@@ -146,3 +181,54 @@ def initializer(obj, attr="_data"):
         return value
 
     return inner
+
+
+@memoize
+def data_schema(data_type):
+    """ Shared schema instance of a marshmallow dataclass """
+    return data_type.Schema()
+
+
+@memoize
+def data_key_fields(data_type):
+    """ Maps serialized data keys of a dataclass to (attribute, field) pairs """
+    schema = data_schema(data_type)
+    return {
+        field.data_key or name: (name, field) for name, field in schema.fields.items()
+    }
+
+
+def deep_merge(base, update):
+    """
+    Merges update into base, recursing into dicts and overriding everything
+    else. Only the dicts along updated paths are copied; base is not modified.
+    """
+    merged = dict(base)
+    for key, value in update.items():
+        existing = merged.get(key)
+        if isinstance(existing, dict) and isinstance(value, dict):
+            merged[key] = deep_merge(existing, value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def patch(obj, data):
+    """
+    Returns a copy of marshmallow dataclass `obj` with serialized partial
+    `data` merged in. Only the fields present in `data` are (de)serialized.
+    """
+    fields = data_key_fields(type(obj))
+    changes = {}
+    for key, value in data.items():
+        if key not in fields:
+            continue
+
+        name, field = fields[key]
+        if isinstance(value, dict):
+            current = field.serialize(name, obj)
+            if isinstance(current, dict):
+                value = deep_merge(current, value)
+        changes[name] = field.deserialize(value)
+
+    return replace(obj, **changes) if changes else obj
@@ -1,13 +1,4 @@
-def memoize(func):
-    memo = {}
-
-    def inner(*args, **kwargs):
-        key = str(dict(args=args, kwargs=kwargs))
-        if key not in memo:
-            memo[key] = func(*args, **kwargs)
-        return memo[key]
-
-    return inner
+from thinq2.util.cache import Cache, cached_property, invalidate, memoize
 
 
 def end_with(string, end):
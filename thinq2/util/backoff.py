@@ -0,0 +1,22 @@
+import random
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter: the delay before retry `attempt`
+    (counting from 0) is drawn between half and all of
+    min(maximum, initial * factor ** attempt), so clients that failed
+    together don't retry in lockstep.
+    """
+
+    def __init__(self, initial=1.0, maximum=120.0, factor=2.0, jitter=True):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        ceiling = min(self.maximum, self.initial * self.factor ** min(attempt, 64))
+        if not self.jitter:
+            return ceiling
+        return random.uniform(ceiling / 2, ceiling)
@@ -0,0 +1,171 @@
+import time
+import threading
+
+from collections import OrderedDict
+from functools import wraps
+
+_MISSING = object()
+_INSTANCE_LOCK = threading.Lock()
+
+
+class Cache:
+    """ Thread-safe LRU cache with an optional per-entry TTL """
+
+    def __init__(self, maxsize=128, ttl=None, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+
+            value, expires = entry
+            if expires is not None and expires <= self._timer():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=_MISSING):
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires = None if ttl is None else self._timer() + ttl
+
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory, ttl=_MISSING):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        # factory runs unlocked; if another thread won the race keep its value
+        value = factory()
+        with self._lock:
+            existing = self.get(key, _MISSING)
+            if existing is not _MISSING:
+                return existing
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key=_MISSING):
+        """ Drops a single key, or every entry if no key is given """
+        with self._lock:
+            if key is _MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _make_key(args, kwargs):
+    key = args
+    if kwargs:
+        key += (_MISSING,) + tuple(sorted(kwargs.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def memoize(func=None, *, maxsize=128, ttl=None):
+    """
+    Memoizes a plain function in a bounded LRU cache.
+
+    Arguments are hashed as-is, so objects without their own __eq__ are keyed
+    by identity. Calls with unhashable arguments bypass the cache. Use
+    cached_property for per-instance values.
+    """
+
+    def decorator(func):
+        cache = Cache(maxsize=maxsize, ttl=ttl)
+
+        @wraps(func)
+        def inner(*args, **kwargs):
+            key = _make_key(args, kwargs)
+            if key is None:
+                return func(*args, **kwargs)
+            return cache.get_or_set(key, lambda: func(*args, **kwargs))
+
+        inner.cache = cache
+        return inner
+
+    if func is None:
+        return decorator
+    return decorator(func)
+
+
+class cached_property:
+    """
+    Property whose value is computed once and stored on the instance itself,
+    so it is released together with the instance. Values can optionally
+    expire after `ttl` seconds and are dropped with `invalidate`.
+    """
+
+    attr = "_cached_properties"
+
+    def __init__(self, func=None, *, ttl=None):
+        self.func = func
+        self.ttl = ttl
+        self.name = getattr(func, "__name__", None)
+        self.__doc__ = getattr(func, "__doc__", None)
+
+    def __call__(self, func):
+        """ Allows use as @cached_property(ttl=...) """
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+        return self
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        cache = self.cache_for(instance)
+        return cache.get_or_set(self.name, lambda: self.func(instance), self.ttl)
+
+    def __set__(self, instance, value):
+        self.cache_for(instance).set(self.name, value, self.ttl)
+
+    def __delete__(self, instance):
+        self.cache_for(instance).invalidate(self.name)
+
+    @classmethod
+    def cache_for(cls, instance):
+        # bypass __getattr__/__setattr__ overrides (eg. controller classes)
+        try:
+            return object.__getattribute__(instance, cls.attr)
+        except AttributeError:
+            with _INSTANCE_LOCK:
+                try:
+                    return object.__getattribute__(instance, cls.attr)
+                except AttributeError:
+                    cache = Cache(maxsize=None)
+                    object.__setattr__(instance, cls.attr, cache)
+                    return cache
+
+
+def invalidate(instance, *names):
+    """ Drops cached properties of an instance (all of them if no names given) """
+    cache = cached_property.cache_for(instance)
+    if not names:
+        cache.invalidate()
+    for name in names:
+        cache.invalidate(name)
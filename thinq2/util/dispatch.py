@@ -0,0 +1,152 @@
+import threading
+
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+
+class CoalescingDispatcher:
+    """
+    Hands items from a producer thread (eg. paho's network thread) to a pool
+    of worker threads.
+
+    Items are keyed (eg. by device_id): items for one key are handled in
+    order and never concurrently, and an item submitted while an older one
+    for the same key is still waiting is folded into it with `merge`
+    (latest wins by default). At most `max_pending` keys can be waiting;
+    beyond that new keys are dropped so a burst can't grow memory unbounded.
+    """
+
+    def __init__(self, handler, workers=2, max_pending=256, merge=None, logger=None):
+        self.handler = handler
+        self.max_pending = max_pending
+        self.merge = merge or (lambda pending, item: item)
+        self.logger = logger
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+        self._pending = OrderedDict()
+        self._ready = deque()
+        self._active = set()
+        # workers wait on _cond for keys, drain() on _idle, so a submit
+        # can't wake a drainer in place of a worker
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._running = True
+        self._threads = [
+            threading.Thread(
+                target=self._work, name="thinq-dispatch-{}".format(n), daemon=True
+            )
+            for n in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, item):
+        """ Queues item for key; returns False if it was dropped """
+        with self._cond:
+            self.submitted += 1
+            if key in self._pending:
+                self._pending[key] = self.merge(self._pending[key], item)
+                self.coalesced += 1
+                return True
+
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+
+            self._pending[key] = item
+            if key not in self._active:
+                self._ready.append(key)
+                self._cond.notify()
+            return True
+
+    @property
+    def depth(self):
+        """ Number of keys with an item waiting """
+        return len(self._pending)
+
+    def drain(self, timeout=None):
+        """ Waits until nothing is pending or being handled; False on timeout """
+        with self._cond:
+            return self._idle.wait_for(
+                lambda: not self._pending and not self._active, timeout
+            )
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while self._running and not self._ready:
+                    self._cond.wait()
+                if not self._running:
+                    return
+
+                key = self._ready.popleft()
+                item = self._pending.pop(key)
+                self._active.add(key)
+
+            try:
+                self.handler(key, item)
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error("dispatch of %s failed: %s", key, e, exc_info=True)
+            finally:
+                with self._cond:
+                    self._active.discard(key)
+                    if key in self._pending:
+                        self._ready.append(key)
+                        self._cond.notify()
+                    elif not self._active and not self._pending:
+                        self._idle.notify_all()
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time: callers arriving while a call for the
+    same key is in flight wait for it and share its result or exception,
+    instead of repeating it.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Future()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            return flight.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            self._land(key)
+            flight.set_exception(e)
+            raise
+        self._land(key)
+        flight.set_result(result)
+        return result
+
+    def _land(self, key):
+        # later callers start a new call rather than get this (older) result
+        with self._lock:
+            del self._flights[key]
@@ -1,15 +1,44 @@
 import os
 
-from tempfile import TemporaryDirectory, mkstemp
+from contextlib import contextmanager
+from tempfile import mkstemp
 
 
-class TempDir:
-    def __init__(self):
-        self._dir = TemporaryDirectory()
+def atomic_write(path, content: str):
+    """Writes content via a temp file + rename so readers never see partial files"""
+    directory = os.path.dirname(path) or "."
+    fh, temp_path = mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fh, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
 
-    def file(self, content: str = None):
-        fh, path = mkstemp(dir=self._dir.name)
-        if content is not None:
-            os.write(fh, str.encode(content))
-        os.close(fh)
-        return path
+
+@contextmanager
+def ephemeral_file(content: str):
+    """
+    Yields a path to content that only exists while the context is open, for
+    APIs that insist on a filename. On Linux the file is an anonymous memfd
+    and never touches the disk; elsewhere it is a private temp file.
+    """
+    if hasattr(os, "memfd_create") and os.path.isdir("/proc/self/fd"):
+        fd = os.memfd_create("thinq2")
+        try:
+            with open(fd, "w", closefd=False) as f:
+                f.write(content)
+            yield "/proc/self/fd/{}".format(fd)
+        finally:
+            os.close(fd)
+    else:
+        fh, path = mkstemp()
+        try:
+            with os.fdopen(fh, "w") as f:
+                f.write(content)
+            yield path
+        finally:
+            os.unlink(path)
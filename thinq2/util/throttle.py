@@ -0,0 +1,115 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: `rate` tokens per second are added up to
+    `capacity`, and every acquire takes one, waiting for it if necessary.
+    Threads are served in the order they arrive.
+    """
+
+    def __init__(self, rate=5.0, capacity=20):
+        self.rate = rate
+        self.capacity = capacity
+        self.waited = 0.0
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, rate=None, capacity=None):
+        with self._lock:
+            self._refill()
+            self.rate = rate or self.rate
+            self.capacity = capacity or self.capacity
+            self._tokens = min(self._tokens, self.capacity)
+
+    def acquire(self):
+        """ Takes a token, sleeping until one is available; returns the wait """
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    def reserve(self):
+        """ Takes a token without waiting; returns how long to wait for it """
+        with self._lock:
+            self._refill()
+            # tokens may go negative: later callers queue behind this one
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += delay
+        return delay
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+
+class CircuitOpen(Exception):
+    """ Raised instead of calling through an open circuit """
+
+    def __init__(self, name, retry_after):
+        super().__init__(
+            "{} is failing, retry in {:.0f}s".format(name, retry_after)
+        )
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while. After `threshold`
+    consecutive failures (or one failure recorded with trip=True, eg. a
+    throttling response) the circuit opens for `reset_timeout` seconds,
+    doubling up to `max_timeout` while it keeps failing. Once the timeout
+    has passed a single trial call is let through: success closes the
+    circuit, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, name, threshold=3, reset_timeout=30, max_timeout=600):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.max_timeout = max_timeout
+        self.state = self.CLOSED
+        self.opened = 0
+        self._failures = 0
+        self._timeout = reset_timeout
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """ Raises CircuitOpen unless a call may go through now """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+
+            now = time.monotonic()
+            if self.state == self.OPEN and now >= self._retry_at:
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpen(self.name, max(0.0, self._retry_at - now))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._timeout = self.reset_timeout
+
+    def record_failure(self, trip=False):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN:
+                self._timeout = min(self._timeout * 2, self.max_timeout)
+            elif not trip and self._failures < self.threshold:
+                return
+
+            self.state = self.OPEN
+            self.opened += 1
+            self._retry_at = time.monotonic() + self._timeout